@@ -0,0 +1,102 @@
+"""
+Member cache cost of the default intents versus LEAN_MEMBERS on a large guild.
+
+Feeds py-cord's ConnectionState the gateway payloads Discord sends for one guild under each set of intents:
+with members and presences every member arrives (GUILD_CREATE plus member chunks) together with their
+presences and a stream of PRESENCE_UPDATE events, in lean mode only the members in voice channels arrive.
+
+    python benchmarks/bench_members.py --members 1000,25000 --updates 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'clanbotjukebox'))
+
+import discord  # noqa: E402
+from discord.state import ConnectionState  # noqa: E402
+
+BASE_ID = 10 ** 17
+VOICE_CHANNEL = BASE_ID - 1
+
+
+def member(index):
+    return {'user': {'id': str(BASE_ID + index), 'username': f'user{index}', 'discriminator': '0001', 'avatar': None},
+            'roles': [], 'joined_at': '2020-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'nick': None}
+
+
+def presence(index, game):
+    return {'user': {'id': str(BASE_ID + index)}, 'guild_id': '1', 'status': 'online',
+            'activities': [{'name': game, 'type': 0}], 'client_status': {'desktop': 'online'}}
+
+
+def guild_create(members, listeners, lean):
+    everyone = {'id': '1', 'name': '@everyone', 'permissions': '0', 'position': 0, 'color': 0, 'hoist': False,
+                'managed': False, 'mentionable': False}
+    voice = {'id': str(VOICE_CHANNEL), 'type': 2, 'name': 'music', 'position': 0, 'permission_overwrites': [],
+             'bitrate': 64000, 'user_limit': 0}
+    voice_states = [{'user_id': str(BASE_ID + index), 'channel_id': str(VOICE_CHANNEL), 'session_id': 'session',
+                     'deaf': False, 'mute': False, 'self_deaf': False, 'self_mute': False, 'suppress': False}
+                    for index in range(listeners)]
+    return {'id': '1', 'name': 'guild', 'owner_id': str(BASE_ID), 'roles': [everyone], 'emojis': [], 'stickers': [],
+            'features': [], 'channels': [voice], 'member_count': members, 'large': members >= 250,
+            'voice_states': voice_states, 'preferred_locale': 'en-US',
+            # Without the members intent Discord only includes the members in voice channels
+            'members': [member(index) for index in range(listeners if lean else members)],
+            'presences': [] if lean else [presence(index, 'game') for index in range(members // 2)]}
+
+
+def run(members, listeners, updates, lean):
+    intents = discord.Intents(guilds=True, voice_states=True, guild_messages=True, members=not lean,
+                              presences=not lean)
+    state = ConnectionState(dispatch=lambda *args, **kwargs: None, handlers={}, hooks={}, http=None,
+                            loop=asyncio.new_event_loop(), intents=intents, chunk_guilds_at_startup=False,
+                            member_cache_flags=discord.MemberCacheFlags.from_intents(intents))
+    payloads = [('GUILD_CREATE', guild_create(members, listeners, lean))]
+    if not lean:
+        payloads += [('PRESENCE_UPDATE', presence(index % members, f'game {index}')) for index in range(updates)]
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    traffic = 0
+    for event, data in payloads:
+        traffic += len(json.dumps({'op': 0, 't': event, 'd': data}))
+        if event == 'GUILD_CREATE':
+            guild = discord.Guild(data=data, state=state)
+            state._add_guild(guild)
+            # Voice members are cached from their VOICE_STATE_UPDATE, like after they join
+            for index in range(listeners):
+                guild._add_member(discord.Member(data=member(index), guild=guild, state=state))
+        else:
+            state.parse_presence_update(data)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    guild = state._get_guild(1)
+    return {'events': len(payloads), 'traffic': traffic, 'memory': memory, 'seconds': elapsed,
+            'cached': len(guild.members), 'voice': len(guild.get_channel(VOICE_CHANNEL).voice_states)}
+
+
+def main(args):
+    print(f"{'members':>8} {'mode':<8}{'events':>8}{'gateway MiB':>13}{'cache MiB':>11}{'parse s':>9}"
+          f"{'cached':>8}{'in voice':>10}")
+    for members in args.members:
+        for lean in (False, True):
+            result = run(members, args.listeners, args.updates, lean)
+            print(f"{members:>8} {'lean' if lean else 'default':<8}{result['events']:>8}"
+                  f"{result['traffic'] / 2 ** 20:>13.2f}{result['memory'] / 2 ** 20:>11.2f}"
+                  f"{result['seconds']:>9.3f}{result['cached']:>8}{result['voice']:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=lambda value: [int(count) for count in value.split(',')],
+                        default=[1000, 25000], help="comma separated guild sizes")
+    parser.add_argument('--listeners', type=int, default=20, help="members in the voice channel")
+    parser.add_argument('--updates', type=int, default=5000, help="presence updates received in default mode")
+    main(parser.parse_args())
@@ -0,0 +1,165 @@
+"""
+Offline throughput benchmark for the music cog.
+
+Every simulated guild runs the same session concurrently: /music with a track, a playlist and a Spotify
+playlist, a search picked from SongSelect, the player controls and every Buttons callback, and finally the
+last listener leaving and rejoining the voice channel. Discord is replaced by the stubs in fakediscord.py and Lavalink
+(and the Spotify API) by the local server in fakelavalink.py.
+
+    python benchmarks/bench_music.py --guilds 1,100,1000 --latency 0.02
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'clanbotjukebox'))
+
+import discord  # noqa: E402
+import lavalink  # noqa: E402
+
+import metrics  # noqa: E402
+import settings  # noqa: E402
+from fakediscord import FakeBot, FakeContext, FakeInteraction  # noqa: E402
+from fakelavalink import FakeLavalink  # noqa: E402
+
+from cogs import music  # noqa: E402
+
+BUTTONS = [('button_pause', 0), ('button_resume', 0), ('button_shuffle', 3), ('button_loop', 4),
+           ('button_queue', 5), ('button_skip', 1)]
+
+
+async def timed(timings, name, coro):
+    start = time.perf_counter()
+    await coro
+    timings[name].append(time.perf_counter() - start)
+
+
+async def setup_session(bot, cog, guild, listener, timings, args):
+    ctx = FakeContext(guild, listener)
+    command = type(cog).music.callback
+    await timed(timings, 'music_track', command(cog, ctx, search=f'https://fake.test/track/{guild.id}'))
+    await timed(timings, 'music_playlist', command(cog, ctx, search=f'https://fake.test/playlist/{args.playlist}'))
+    await timed(timings, 'music_spotify',
+                command(cog, ctx, search=f'https://open.spotify.com/playlist/mix{args.spotify}'))
+
+    player = bot.lavalink.player_manager.get(guild.id)
+    results = await cog.cache.get_tracks(player.node, f'ytsearch:benchmark song {guild.id % 50}')
+    select = music.SongSelect(bot, results.tracks[:5], listener)
+    view = discord.ui.View(timeout=None)
+    view.add_item(select)
+    select._selected_values = [results.tracks[0].title]
+    await timed(timings, 'song_select', select.callback(FakeInteraction(guild, listener)))
+
+    await timed(timings, 'music_controls', command(cog, ctx, search=None))
+
+
+async def finish_session(bot, cog, guild, listener, timings):
+    view = music.Buttons(bot)
+    for name, index in BUTTONS:
+        await timed(timings, name, view.children[index].callback(FakeInteraction(guild, listener)))
+
+    # Leaving pauses the player for the idle timeout, rejoining resumes it
+    inside = types.SimpleNamespace(channel=guild.voice_channel)
+    outside = types.SimpleNamespace(channel=None)
+    guild.voice_channel.members.remove(listener)
+    await timed(timings, 'voice_leave', cog.on_voice_state_update(listener, inside, outside))
+    guild.voice_channel.members.append(listener)
+    await timed(timings, 'voice_rejoin', cog.on_voice_state_update(listener, outside, inside))
+
+
+async def run(guild_count, args):
+    server = await FakeLavalink(latency=args.latency, spotify_latency=args.latency).start()
+    settings.DISCORD_LAVALINK_NODES = [{'host': '127.0.0.1', 'port': server.port, 'password': server.password,
+                                        'region': 'eu'}]
+    settings.DISCORD_IMPORT_PROGRESS_INTERVAL = 3600
+    music.sp.api_url = f'{server.spotify_url}/v1'
+    music.sp.auth_url = f'{server.spotify_url}/token'
+    for hooks in lavalink.Client._event_hooks.values():
+        hooks.clear()
+
+    bot = FakeBot()
+    cog = music.Music(bot)
+    while not cog.ready.is_set():
+        await asyncio.sleep(0.05)
+
+    sessions = []
+    for _ in range(guild_count):
+        guild = bot.add_guild()
+        listener = guild.add_member("listener", kick_members=True)
+        listener.voice = types.SimpleNamespace(channel=guild.voice_channel)
+        guild.voice_channel.members.append(listener)
+        sessions.append((guild, listener))
+
+    timings = collections.defaultdict(list)
+    shared = metrics.SINGLE_FLIGHT.values.get(('shared',), 0)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    await asyncio.gather(*(setup_session(bot, cog, guild, listener, timings, args) for guild, listener in sessions))
+    memory = (tracemalloc.get_traced_memory()[0] - baseline) / guild_count
+    tracemalloc.stop()
+    # Guilds share in-flight lookups, never the tracks they queue, those carry each guild's requester
+    queued = [id(track) for guild, _ in sessions
+              for player in (bot.lavalink.player_manager.get(guild.id),) for track in [player.current, *player.queue]]
+    assert len(set(queued)) == len(queued), "guilds share queued track objects"
+    await asyncio.gather(*(finish_session(bot, cog, guild, listener, timings) for guild, listener in sessions))
+    wall = time.perf_counter() - start
+    # Give the now playing updater one interval to render what the sessions changed
+    await asyncio.sleep(settings.DISCORD_NOW_PLAYING_INTERVAL + 1)
+    messages = {'sent': sum(guild.text_channel.sent for guild, _ in sessions),
+                'edited': sum(guild.text_channel.edits for guild, _ in sessions)}
+    shared = metrics.SINGLE_FLIGHT.values.get(('shared',), 0) - shared
+
+    # Tearing the node down makes the pool try to fail players over, which is just noise here
+    logging.disable(logging.CRITICAL)
+    cog.cog_unload()
+    for node in list(bot.lavalink.node_manager):
+        await node.destroy()
+    await bot.lavalink._session.close()
+    await server.stop()
+    await asyncio.sleep(0)
+    logging.disable(logging.NOTSET)
+    return timings, wall, memory, dict(server.requests), messages, shared
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def report(guild_count, timings, wall, memory, requests, messages, shared):
+    operations = sum(len(values) for values in timings.values())
+    print(f"\n== {guild_count} guild(s): {operations} operations in {wall:.2f}s "
+          f"= {operations / wall:.1f} commands/s, {memory / 1024:.1f} KiB per guild")
+    print(f"   {'operation':<16}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, values in timings.items():
+        print(f"   {name:<16}{len(values):>7}{statistics.median(values) * 1000:>10.2f}"
+              f"{percentile(values, 0.99) * 1000:>10.2f}")
+    print(f"   fake server requests: {requests}, {shared} saved by sharing in-flight lookups")
+    print(f"   discord channel messages: {messages}")
+
+
+async def main(args):
+    for guild_count in args.guilds:
+        report(guild_count, *await run(guild_count, args))
+    await music.sp.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=lambda value: [int(count) for count in value.split(',')],
+                        default=[1, 100, 1000], help="comma separated guild counts to simulate")
+    parser.add_argument('--latency', type=float, default=0.02, help="fake Lavalink and Spotify latency in seconds")
+    parser.add_argument('--playlist', type=int, default=50, help="tracks in the Lavalink playlist")
+    parser.add_argument('--spotify', type=int, default=20, help="tracks in the Spotify playlist")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,125 @@
+"""
+Player placement and failover over several Lavalink nodes.
+
+Starts one fake Lavalink server per --cpu value, queues a track in every guild with /music so NodePool places the
+players, seeks every player to its own position and then stops the first node. Reports where the players were
+placed, how long it took to move the players of the stopped node and how far their restarted position is from
+where they were. Discord is replaced by the stubs in fakediscord.py and Lavalink by fakelavalink.py.
+
+    python benchmarks/bench_nodes.py --guilds 60 --cpu 0.05,0.05,0.3
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'clanbotjukebox'))
+
+import lavalink  # noqa: E402
+
+import settings  # noqa: E402
+from fakediscord import FakeBot, FakeContext  # noqa: E402
+from fakelavalink import FakeLavalink  # noqa: E402
+
+from cogs import music  # noqa: E402
+
+
+async def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    servers = [await FakeLavalink(latency=args.latency, cpu=cpu).start() for cpu in args.cpu]
+    settings.DISCORD_LAVALINK_NODES = [{'host': '127.0.0.1', 'port': server.port, 'password': server.password,
+                                        'region': 'eu', 'name': f'node{index}'}
+                                       for index, server in enumerate(servers)]
+    for hooks in lavalink.Client._event_hooks.values():
+        hooks.clear()
+
+    bot = FakeBot()
+    cog = music.Music(bot)
+    await wait_for(lambda: cog.ready.is_set())
+    await wait_for(lambda: all(node.available and not node.stats.is_fake for node in cog.nodes.nodes))
+    servers = {server.port: server for server in servers}
+
+    players = []
+    for _ in range(args.guilds):
+        guild = bot.add_guild()
+        listener = guild.add_member("listener", kick_members=True)
+        listener.voice = types.SimpleNamespace(channel=guild.voice_channel)
+        guild.voice_channel.members.append(listener)
+        ctx = FakeContext(guild, listener)
+        await music.Music.music.callback(cog, ctx, search=f'https://fake.test/track/{guild.id}')
+        players.append(bot.lavalink.player_manager.get(guild.id))
+
+    print(f"{args.guilds} guilds over {len(servers)} nodes, {args.latency * 1000:.0f} ms fake latency")
+    print(f"   {'node':<8}{'cpu':>6}{'players':>9}")
+    placed = {node.name: len(node.players) for node in cog.nodes.nodes}
+    for node in cog.nodes.nodes:
+        print(f"   {node.name:<8}{servers[node.port].cpu:>6.2f}{placed[node.name]:>9}")
+    # Every join went to the node with the lowest score, so equally loaded nodes differ by at most one player
+    # and a busier node never holds more players than a quieter one
+    by_cpu = {}
+    for node in cog.nodes.nodes:
+        by_cpu.setdefault(servers[node.port].cpu, []).append(placed[node.name])
+    for counts in by_cpu.values():
+        assert max(counts) - min(counts) <= 1, f"uneven placement on equal nodes: {placed}"
+    ordered = [min(by_cpu[cpu]) for cpu in sorted(by_cpu)]
+    assert ordered == sorted(ordered, reverse=True), f"busier node got more players: {placed}"
+
+    for index, player in enumerate(players):
+        await player.play(player.current, start_time=10000 + index * 1000)
+    await wait_for(lambda: all(player._last_position >= 10000 for player in players))
+    # Play on past the last player update, that time has to survive the move as well
+    await asyncio.sleep(0.5)
+
+    down = cog.nodes.nodes[0]
+    moving = list(down.players)
+    logging.disable(logging.CRITICAL)
+    positions = {player.guild_id: player.position for player in moving}
+    start = time.perf_counter()
+    await servers[down.port].stop()
+    await wait_for(lambda: all(player.node is not down and str(player.guild_id) in servers[player.node.port].players
+                               for player in moving))
+    elapsed = time.perf_counter() - start
+    logging.disable(logging.NOTSET)
+
+    drift = [servers[player.node.port].players[str(player.guild_id)]['startTime'] - positions[player.guild_id]
+             for player in moving]
+    targets = {}
+    for player in moving:
+        targets[player.node.name] = targets.get(player.node.name, 0) + 1
+    print(f"   stopped {down.name}: moved {len(moving)} players in {elapsed * 1000:.0f} ms to {targets}, "
+          f"restart position drift {min(drift):.0f} to {max(drift):.0f} ms")
+    assert all(0 <= value < 1000 for value in drift), f"position not kept: {drift}"
+
+    logging.disable(logging.CRITICAL)
+    cog.cog_unload()
+    for node in list(bot.lavalink.node_manager):
+        await node.destroy()
+    await bot.lavalink._session.close()
+    for server in servers.values():
+        if server.runner.server is not None:
+            await server.stop()
+    await music.sp.close()
+    await asyncio.sleep(0)
+    logging.disable(logging.NOTSET)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=60, help="guilds to place")
+    parser.add_argument('--cpu', type=lambda value: [float(cpu) for cpu in value.split(',')],
+                        default=[0.05, 0.05, 0.3], help="comma separated Lavalink CPU load of every fake node")
+    parser.add_argument('--latency', type=float, default=0.005, help="fake Lavalink latency in seconds")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(parser.parse_args()))
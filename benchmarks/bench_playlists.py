@@ -0,0 +1,113 @@
+"""
+Time to queue a saved playlist versus importing the same songs again.
+
+Every round imports a Spotify playlist the way /music does without lazy imports (one ytsearch per song, with an
+empty track cache and Spotify track map), saves the queue with /playlist save, clears the player and queues it
+again with /playlist load.
+Discord is replaced by the stubs in fakediscord.py and Lavalink (and the Spotify API) by the local server in
+fakelavalink.py.
+
+    python benchmarks/bench_playlists.py --size 250 --rounds 5 --latency 0.02
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'clanbotjukebox'))
+
+import lavalink  # noqa: E402
+
+import settings  # noqa: E402
+from fakediscord import FakeBot, FakeContext  # noqa: E402
+from fakelavalink import FakeLavalink  # noqa: E402
+
+from cogs import music  # noqa: E402
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+def requests(server):
+    return sum(count for name, count in server.requests.items() if not name.startswith('ws:'))
+
+
+async def run(args):
+    server = await FakeLavalink(latency=args.latency, spotify_latency=args.latency).start()
+    settings.DISCORD_LAVALINK_NODES = [{'host': '127.0.0.1', 'port': server.port, 'password': server.password,
+                                        'region': 'eu'}]
+    settings.DISCORD_IMPORT_PROGRESS_INTERVAL = 3600
+    settings.DISCORD_LAZY_IMPORTS = False
+    music.sp.api_url = f'{server.spotify_url}/v1'
+    music.sp.auth_url = f'{server.spotify_url}/token'
+    for hooks in lavalink.Client._event_hooks.values():
+        hooks.clear()
+
+    bot = FakeBot()
+    cog = music.Music(bot)
+    while not cog.ready.is_set():
+        await asyncio.sleep(0.05)
+    guild = bot.add_guild()
+    listener = guild.add_member("listener", kick_members=True)
+    listener.voice = types.SimpleNamespace(channel=guild.voice_channel)
+    guild.voice_channel.members.append(listener)
+
+    results = {'resolve': [], 'saved': []}
+    counts = {'resolve': [], 'saved': []}
+    queued = {}
+    for _ in range(args.rounds):
+        ctx = FakeContext(guild, listener)
+        cog.cache._entries.clear()
+        cog.spotify_map._tracks.clear()
+        before = requests(server)
+        results['resolve'].append(await timed(music.Music.music.callback(
+            cog, ctx, search=f'https://open.spotify.com/playlist/mix{args.size}')))
+        counts['resolve'].append(requests(server) - before)
+        player = bot.lavalink.player_manager.get(guild.id)
+        queued['resolve'] = len(player.queue) + 1
+        await music.Music.save.callback(cog, FakeContext(guild, listener), name='bench')
+        await player.actor.call(music.cleanup)
+
+        before = requests(server)
+        results['saved'].append(await timed(music.Music.load.callback(cog, FakeContext(guild, listener), name='bench')))
+        counts['saved'].append(requests(server) - before)
+        queued['saved'] = len(player.queue) + 1
+        await player.actor.call(music.cleanup)
+
+    logging.disable(logging.CRITICAL)
+    cog.cog_unload()
+    for node in list(bot.lavalink.node_manager):
+        await node.destroy()
+    await bot.lavalink._session.close()
+    await server.stop()
+    await music.sp.close()
+    await asyncio.sleep(0)
+    logging.disable(logging.NOTSET)
+    return results, counts, queued
+
+
+def main(args):
+    results, counts, queued = asyncio.run(run(args))
+    print(f"{args.size} song playlist, {args.rounds} rounds, {args.latency * 1000:.0f} ms fake latency")
+    print(f"   {'mode':<12}{'songs':>7}{'p50 ms':>10}{'max ms':>10}{'requests':>10}")
+    for mode, label in (('resolve', 're-resolve'), ('saved', 'saved')):
+        print(f"   {label:<12}{queued[mode]:>7}{statistics.median(results[mode]) * 1000:>10.2f}"
+              f"{max(results[mode]) * 1000:>10.2f}{statistics.median(counts[mode]):>10.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=250, help="songs in the playlist")
+    parser.add_argument('--rounds', type=int, default=5, help="times each mode is measured")
+    parser.add_argument('--latency', type=float, default=0.02, help="fake Lavalink and Spotify latency in seconds")
+    logging.basicConfig(level=logging.WARNING)
+    main(parser.parse_args())
@@ -0,0 +1,140 @@
+"""
+Round trip of a large queue through the QueueStore and a restart of the music cog.
+
+Fills one guild's queue with a Lavalink playlist and a lazily imported Spotify playlist, seeks the current track and
+changes the player settings, then unloads the cog and starts a new one on the same store file, like a restart.
+Checks that the restored player plays the same track from the same position in the same voice channel with the
+same queue, requesters and settings, and reports how long saving, loading and restoring took.
+Discord is replaced by the stubs in fakediscord.py and Lavalink (and the Spotify API) by fakelavalink.py.
+
+    python benchmarks/bench_queuestore.py --playlist 4000 --spotify 500
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'clanbotjukebox'))
+
+import lavalink  # noqa: E402
+
+import settings  # noqa: E402
+from fakediscord import FakeBot, FakeContext  # noqa: E402
+from fakelavalink import FakeLavalink  # noqa: E402
+
+from cogs import music  # noqa: E402
+
+
+async def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+def entries(player):
+    return [(track.track, track.requester, track.extra.get('requester_name'), track.extra.get('query'))
+            for track in player.queue]
+
+
+async def start(bot):
+    for hooks in lavalink.Client._event_hooks.values():
+        hooks.clear()
+    cog = music.Music(bot)
+    await wait_for(lambda: cog.ready.is_set())
+    return cog
+
+
+async def stop(bot, cog):
+    # The nodes going away make the old players try to fail over, which is just noise here
+    logging.disable(logging.CRITICAL)
+    cog.cog_unload()
+    for node in list(bot.lavalink.node_manager):
+        await node.destroy()
+    await bot.lavalink._session.close()
+    await asyncio.sleep(0.1)
+    logging.disable(logging.NOTSET)
+
+
+async def run(args, path):
+    server = await FakeLavalink(latency=args.latency, spotify_latency=args.latency).start()
+    settings.DISCORD_LAVALINK_NODES = [{'host': '127.0.0.1', 'port': server.port, 'password': server.password,
+                                        'region': 'eu'}]
+    settings.DISCORD_QUEUE_STORE_PATH = path
+    settings.DISCORD_QUEUE_STORE_INTERVAL = 3600
+    settings.DISCORD_IMPORT_PROGRESS_INTERVAL = 3600
+    music.sp.api_url = f'{server.spotify_url}/v1'
+    music.sp.auth_url = f'{server.spotify_url}/token'
+
+    bot = FakeBot()
+    cog = await start(bot)
+    guild = bot.add_guild()
+    listener = guild.add_member("listener", kick_members=True)
+    listener.voice = types.SimpleNamespace(channel=guild.voice_channel)
+    guild.voice_channel.members.append(listener)
+    command = music.Music.music.callback
+    await command(cog, FakeContext(guild, listener), search=f'https://fake.test/playlist/{args.playlist}')
+    await command(cog, FakeContext(guild, listener), search=f'https://open.spotify.com/playlist/mix{args.spotify}')
+
+    player = bot.lavalink.player_manager.get(guild.id)
+    await player.play(player.current, start_time=args.position)
+    await wait_for(lambda: player._last_position == args.position)
+    player.set_loop(2)
+    await player.set_volume(40)
+    # What the periodic flush of QueueStore.run records
+    cog.store.save_position(player)
+    before = {'current': player.current.track, 'position': player.position, 'loop': player.loop,
+              'volume': player.volume, 'shuffle': player.shuffle, 'queue': entries(player)}
+    saving = time.perf_counter()
+    await cog.store.flush()
+    saving = time.perf_counter() - saving
+    await stop(bot, cog)
+
+    restarted = FakeBot()
+    restarted.adopt(guild)
+    restoring = time.perf_counter()
+    cog = await start(restarted)
+    restoring = time.perf_counter() - restoring
+    loading = time.perf_counter()
+    snapshots = await cog.store.load()
+    loading = time.perf_counter() - loading
+
+    player = restarted.lavalink.player_manager.get(guild.id)
+    assert player is not None, "player was not restored"
+    assert guild.voice_client is not None and guild.voice_client.channel is guild.voice_channel, "not in voice"
+    assert cog.listeners.count(guild.id) == 1, f"listener index has {cog.listeners.count(guild.id)} listeners"
+    assert player.current.track == before['current'], "restored a different track"
+    assert abs(player.position - before['position']) < 1000, f"position {player.position} != {before['position']}"
+    assert (player.loop, player.volume, player.shuffle) == (before['loop'], before['volume'], before['shuffle'])
+    assert entries(player) == before['queue'], "restored queue differs"
+    assert guild.id in snapshots and len(snapshots[guild.id]['queue']) == len(before['queue']), "snapshot lost"
+
+    print(f"{len(before['queue']) + 1} songs ({args.spotify} lazy), {os.path.getsize(path) / 1024:.0f} KiB store")
+    print(f"   save {saving * 1000:.1f} ms, load {loading * 1000:.1f} ms, restart until ready {restoring * 1000:.1f} ms")
+    print("   restored the current track, position, queue, requesters, settings and voice channel")
+
+    await stop(restarted, cog)
+    await server.stop()
+    await music.sp.close()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(args, os.path.join(directory, 'queues.db')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--playlist', type=int, default=4000, help="tracks in the Lavalink playlist")
+    parser.add_argument('--spotify', type=int, default=500, help="tracks in the lazily imported Spotify playlist")
+    parser.add_argument('--position', type=int, default=95000, help="position of the current track in ms")
+    parser.add_argument('--latency', type=float, default=0.005, help="fake Lavalink and Spotify latency in seconds")
+    logging.basicConfig(level=logging.WARNING)
+    main(parser.parse_args())
@@ -0,0 +1,86 @@
+"""
+Event loop lag while SpotifyResolver imports a large playlist.
+
+The Spotify Web API is replaced by the local fake in fakelavalink.py. While the import runs,
+metrics.monitor_event_loop samples how late the loop wakes up a sleeping task; the same sampling
+without an import gives the baseline of the machine. The fake server runs on the same loop, so the
+import lag includes serving the responses and is an upper bound of what the bot sees. The run fails
+when an import adds more than --max-lag to the idle p99.
+
+    python benchmarks/bench_spotify_lag.py --size 500 --rounds 5 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'clanbotjukebox'))
+
+import metrics  # noqa: E402
+from fakelavalink import FakeLavalink  # noqa: E402
+from spotifyresolver import SpotifyResolver  # noqa: E402
+
+
+class Samples(list):
+    """ Collects the lag samples instead of bucketing them like the metrics histogram """
+
+    def observe(self, value):
+        self.append(value)
+
+
+async def sampled(coro, interval):
+    samples = Samples()
+    monitor = asyncio.create_task(metrics.monitor_event_loop(interval, histogram=samples))
+    start = time.perf_counter()
+    try:
+        result = await coro
+    finally:
+        elapsed = time.perf_counter() - start
+        monitor.cancel()
+    return samples, elapsed, result
+
+
+def report(name, samples, elapsed, songs=None):
+    samples = sorted(samples) or [0.0]
+    p99 = samples[max(int(len(samples) * 0.99) - 1, 0)]
+    extra = f"  {songs} songs in {elapsed * 1000:.0f} ms" if songs is not None else ""
+    print(f"   {name:<10}{len(samples):>9}{statistics.median(samples) * 1000:>10.2f}{p99 * 1000:>10.2f}"
+          f"{samples[-1] * 1000:>10.2f}{extra}")
+    return p99
+
+
+async def run(args):
+    server = await FakeLavalink(spotify_latency=args.latency).start()
+    sp = SpotifyResolver('bench', 'bench', api_url=f'{server.spotify_url}/v1', auth_url=f'{server.spotify_url}/token')
+    url = f'https://open.spotify.com/playlist/mix{args.size}'
+
+    print(f"{args.size} song playlist, {args.rounds} rounds, {args.latency * 1000:.0f} ms fake Spotify latency, "
+          f"sampled every {args.interval * 1000:.1f} ms")
+    print(f"   {'mode':<10}{'samples':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    samples, elapsed, _ = await sampled(asyncio.sleep(args.rounds * 0.2), args.interval)
+    idle = report('idle', samples, elapsed)
+    imports = []
+    for _ in range(args.rounds):
+        samples, elapsed, songs = await sampled(sp.get_tracks(url), args.interval)
+        imports.append(report('import', samples, elapsed, len(songs)))
+
+    await sp.close()
+    await server.stop()
+    # Compared to the idle baseline so a slow machine does not fail the run, only an import that blocks the loop
+    worst = max(imports)
+    assert worst <= idle + args.max_lag, \
+        f"import p99 lag {worst * 1000:.2f} ms is over the idle {idle * 1000:.2f} ms + {args.max_lag * 1000:g} ms"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=500, help="songs in the playlist")
+    parser.add_argument('--rounds', type=int, default=5, help="imports measured")
+    parser.add_argument('--latency', type=float, default=0.02, help="fake Spotify latency in seconds")
+    parser.add_argument('--interval', type=float, default=0.001, help="seconds between lag samples")
+    parser.add_argument('--max-lag', type=float, default=0.05, help="p99 lag in seconds an import may add to idle")
+    asyncio.run(run(parser.parse_args()))
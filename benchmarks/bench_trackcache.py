@@ -0,0 +1,115 @@
+"""
+Compare get_tracks lookup latency with and without the TrackCache.
+The Lavalink node is replaced by a stub with a fixed REST latency.
+
+    python benchmarks/bench_trackcache.py --lookups 500 --queries 100 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'clanbotjukebox'))
+
+import lavalink  # noqa: E402
+
+from trackcache import TrackCache  # noqa: E402
+from trackresolver import TrackResolver  # noqa: E402
+
+
+def fake_track(query, idx):
+    return {
+        'track': f'QAAA{idx:08d}',
+        'info': {'identifier': f'id{idx}', 'isSeekable': True, 'author': 'Benchmark', 'length': 180000,
+                 'isStream': False, 'title': query, 'uri': f'https://youtu.be/id{idx}', 'sourceName': 'youtube'},
+    }
+
+
+class StubNode:
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+
+    async def get_tracks(self, query):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return lavalink.LoadResult.from_dict({
+            'loadType': 'SEARCH_RESULT',
+            'playlistInfo': {},
+            'tracks': [fake_track(query, i) for i in range(5)],
+        })
+
+
+async def run(lookup, queries, lookups):
+    latencies = []
+    for _ in range(lookups):
+        query = random.choice(queries)
+        start = time.perf_counter()
+        await lookup(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+async def shared(name, lookup, node, callers):
+    """
+    Run identical lookups at the same time, they share one request but must not share track objects
+    """
+    results = await asyncio.gather(*(lookup('ytsearch:shared song') for _ in range(callers)))
+    tracks = [id(track) for result in results for track in result.tracks]
+    assert node.requests == 1, f"{name}: {node.requests} requests for {callers} identical lookups"
+    assert len(set(tracks)) == len(tracks), f"{name}: concurrent lookups returned the same track objects"
+    print(f"{name:<12} {callers} concurrent lookups shared 1 request, no track objects shared")
+
+
+def report(name, latencies, requests):
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:<12} p50 {p50:8.3f} ms  p99 {p99:8.3f} ms  mean {statistics.fmean(latencies) * 1000:8.3f} ms"
+          f"  lavalink requests {requests}")
+
+
+async def main(args):
+    queries = [f'ytsearch:artist {i} - song {i}' for i in range(args.queries)]
+
+    node = StubNode(args.latency)
+    report('uncached', await run(node.get_tracks, queries, args.lookups), node.requests)
+
+    node = StubNode(args.latency)
+    cache = TrackCache(max_size=args.queries, ttl=3600, path='')
+    report('memory', await run(lambda q: cache.get_tracks(node, q), queries, args.lookups), node.requests)
+    print(f"{'':<12} {cache.stats}")
+    cache.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.db')
+        warm = TrackCache(max_size=args.queries, ttl=3600, path=path)
+        for query in queries:
+            await warm.get_tracks(StubNode(0), query)
+        warm.close()
+
+        node = StubNode(args.latency)
+        cache = TrackCache(max_size=args.queries, ttl=3600, path=path)
+        report('disk (warm)', await run(lambda q: cache.get_tracks(node, q), queries, args.lookups), node.requests)
+        print(f"{'':<12} {cache.stats}")
+        cache.close()
+
+    node = StubNode(args.latency)
+    cache = TrackCache(max_size=args.queries, ttl=3600, path='')
+    await shared('cache', lambda q: cache.get_tracks(node, q), node, 10)
+    cache.close()
+    node = StubNode(args.latency)
+    resolver = TrackResolver()
+    await shared('resolver', lambda q: resolver.load(node, q), node, 10)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lookups', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated Lavalink REST latency in seconds")
+    asyncio.run(main(parser.parse_args()))
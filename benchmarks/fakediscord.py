@@ -0,0 +1,245 @@
+"""
+Minimal stand-ins for the py-cord objects the music cog touches, so its commands, views and listeners
+can be driven without a gateway connection.
+"""
+import asyncio
+import itertools
+import types
+
+import discord
+
+_ids = itertools.count(10 ** 17)
+
+
+class FakeResponse:
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, *args, **kwargs):
+        self.done = True
+        self.interaction.sent.append((args, kwargs))
+
+    async def edit_message(self, *args, **kwargs):
+        self.done = True
+        self.interaction.sent.append((args, kwargs))
+
+    async def defer(self, *args, **kwargs):
+        self.done = True
+
+
+class FakeTextChannel:
+
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.mention = f'<#{self.id}>'
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return FakeMessage(self)
+
+
+class FakeMessage:
+
+    def __init__(self, channel):
+        self.id = next(_ids)
+        self.channel = channel
+
+    async def edit(self, *args, **kwargs):
+        self.channel.edits += 1
+
+    async def edit_original_message(self, *args, **kwargs):
+        pass
+
+
+class FakeVoiceClient:
+
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+        self.guild = channel.guild
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        player = self.client.lavalink.player_manager.get(self.guild.id)
+        if player:
+            await player._voice_state_update({'channel_id': None, 'session_id': None})
+        self.guild.voice_client = None
+        if self in self.client.voice_clients:
+            self.client.voice_clients.remove(self)
+
+
+class FakeVoiceChannel:
+
+    def __init__(self, client, guild):
+        self.id = next(_ids)
+        self.client = client
+        self.guild = guild
+        self.members = []
+
+    @property
+    def voice_states(self):
+        return {member.id: member.voice for member in self.members}
+
+    async def connect(self, *, cls=None, **kwargs):
+        if self.guild.voice_client is not None:
+            raise discord.ClientException("Already connected to a voice channel.")
+        voice = FakeVoiceClient(self.client, self)
+        self.guild.voice_client = voice
+        self.client.voice_clients.append(voice)
+        self.members.append(self.client.member(self.guild))
+        # What Discord sends back after a voice connect, forwarded to Lavalink like Player does
+        player = self.client.lavalink.player_manager.create(self.guild.id)
+        await player._voice_state_update({'channel_id': str(self.id), 'session_id': f'session-{self.guild.id}'})
+        await player._voice_server_update({'token': 'fake', 'guild_id': str(self.guild.id), 'endpoint': 'fake.test'})
+        return voice
+
+
+class FakeMember:
+
+    def __init__(self, guild, name, bot=False, kick_members=False):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.mention = f'<@{self.id}>'
+        self.guild_permissions = types.SimpleNamespace(kick_members=kick_members)
+        self.voice = None
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+
+    def __init__(self, client):
+        self.id = next(_ids)
+        self.client = client
+        self.voice_client = None
+        self.text_channel = FakeTextChannel(self)
+        self.voice_channel = FakeVoiceChannel(client, self)
+        self.members = {}
+        self.owner = self.add_member("owner", kick_members=True)
+
+    def add_member(self, name, bot=False, kick_members=False):
+        member = FakeMember(self, name, bot=bot, kick_members=kick_members)
+        self.members[member.id] = member
+        return member
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id):
+        for channel in (self.text_channel, self.voice_channel):
+            if channel.id == channel_id:
+                return channel
+        return None
+
+    async def change_voice_state(self, *, channel, **kwargs):
+        pass
+
+
+class FakeContext:
+
+    def __init__(self, guild, author, command='music'):
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text_channel
+        self.command = command
+        self.interaction = FakeInteraction(guild, author)
+        self.sent = []
+
+    @property
+    def response(self):
+        return self.interaction.response
+
+    async def respond(self, *args, **kwargs):
+        self.response.done = True
+        self.sent.append((args, kwargs))
+        return FakeMessage(self.channel)
+
+    async def defer(self, *args, **kwargs):
+        await self.response.defer()
+
+    async def edit(self, *args, **kwargs):
+        self.sent.append((args, kwargs))
+
+    async def delete(self, *args, **kwargs):
+        self.sent.clear()
+
+
+class FakeInteraction:
+
+    def __init__(self, guild, user):
+        self.guild = guild
+        self.user = user
+        self.channel = guild.text_channel
+        self.message = FakeMessage(self.channel)
+        self.response = FakeResponse(self)
+        self.sent = []
+
+    async def edit_original_message(self, *args, **kwargs):
+        self.sent.append((args, kwargs))
+
+
+class FakeBot:
+    """
+    Just enough of commands.Bot for the music cog
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.user = types.SimpleNamespace(id=next(_ids), bot=True, name="jukebox")
+        self.lavalink = None
+        self.voice_clients = []
+        self.guilds = {}
+        self.cogs = {}
+        self._members = {}
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_ready(self):
+        return True
+
+    def member(self, guild):
+        """ The bot's own member in a guild """
+        member = self._members.get(guild.id)
+        if member is None:
+            member = self._members[guild.id] = guild.add_member("jukebox", bot=True)
+            del guild.members[member.id]
+            member.id = self.user.id
+            guild.members[member.id] = member
+        return member
+
+    def add_guild(self):
+        guild = FakeGuild(self)
+        self.guilds[guild.id] = guild
+        return guild
+
+    def adopt(self, guild):
+        """ Take over a guild of another bot, e.g. to simulate a restart """
+        guild.client = guild.voice_channel.client = self
+        guild.voice_client = None
+        self.guilds[guild.id] = guild
+        return guild
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        for guild in self.guilds.values():
+            channel = guild.get_channel(channel_id)
+            if channel is not None:
+                return channel
+        return None
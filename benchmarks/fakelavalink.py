@@ -0,0 +1,201 @@
+"""
+Local stand-in for a Lavalink v3 node (REST + WebSocket) and the Spotify Web API, with configurable latency.
+
+/loadtracks understands:
+    ytsearch:<terms>                  5 search results
+    https://fake.test/playlist/<n>    a playlist of n tracks
+    https://fake.test/fail/...        LOAD_FAILED
+    anything containing spotify       NO_MATCHES, like a real node without a Spotify source
+    any other identifier              a single track
+
+The Spotify API lives under /spotify. Album and playlist ids end in their size, e.g. /spotify/v1/playlists/mix250.
+"""
+import asyncio
+import base64
+import re
+import struct
+
+from aiohttp import web
+
+RSIZE = re.compile(r'(\d+)$')
+
+
+def _utf(text):
+    data = text.encode('utf8')
+    return struct.pack('>H', len(data)) + data
+
+
+def encode_track(info):
+    """
+    Encode track info the way Lavalink does (message version 2), so lavalink.decode_track can read it back
+    """
+    body = (struct.pack('B', 2) + _utf(info['title']) + _utf(info['author']) + struct.pack('>Q', info['length'])
+            + _utf(info['identifier']) + struct.pack('B', info['isStream']) + struct.pack('B', 1)
+            + _utf(info['uri']) + _utf(info['sourceName']) + struct.pack('>Q', 0))
+    return base64.b64encode(struct.pack('>i', len(body) | (1 << 30)) + body).decode()
+
+
+def make_track(identifier, title, author="Fake Artist", length=180000):
+    info = {'identifier': identifier, 'isSeekable': True, 'author': author, 'length': length, 'isStream': False,
+            'position': 0, 'title': title, 'uri': f'https://fake.test/watch/{identifier}', 'sourceName': 'youtube'}
+    return {'track': encode_track(info), 'info': info}
+
+
+class FakeLavalink:
+
+    def __init__(self, latency=0.0, spotify_latency=0.0, password='bench', stats_interval=5.0, cpu=0.05):
+        self.latency = latency
+        self.spotify_latency = spotify_latency
+        self.password = password
+        self.stats_interval = stats_interval
+        self.cpu = cpu
+        self.requests = {}
+        self.players = {}
+        self.sockets = set()
+        self.runner = None
+        self.port = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/', self.websocket)
+        self.app.router.add_get('/loadtracks', self.loadtracks)
+        self.app.router.add_post('/spotify/token', self.spotify_token)
+        self.app.router.add_get('/spotify/v1/tracks/{id}', self.spotify_track)
+        self.app.router.add_get('/spotify/v1/tracks', self.spotify_tracks)
+        self.app.router.add_get('/spotify/v1/{kind}/{id}', self.spotify_collection)
+        self.app.router.add_get('/spotify/v1/{kind}/{id}/tracks', self.spotify_page)
+
+    def _count(self, name):
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    @property
+    def spotify_url(self):
+        return f'http://127.0.0.1:{self.port}/spotify'
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self.drop_connections()
+        await self.runner.cleanup()
+
+    async def drop_connections(self):
+        """ Close every WebSocket, e.g. to simulate the node going down. """
+        for ws in list(self.sockets):
+            await ws.close()
+
+    async def websocket(self, request):
+        if request.headers.get('Authorization') != self.password:
+            raise web.HTTPUnauthorized()
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        stats = asyncio.create_task(self._send_stats(ws))
+        try:
+            async for msg in ws:
+                data = msg.json()
+                self._count(f"ws:{data['op']}")
+                guild_id = data.get('guildId')
+                if data['op'] == 'play':
+                    self.players[guild_id] = data
+                    await ws.send_json({'op': 'playerUpdate', 'guildId': guild_id,
+                                        'state': {'time': 0, 'position': data.get('startTime', 0), 'connected': True}})
+                elif data['op'] in ('stop', 'destroy'):
+                    self.players.pop(guild_id, None)
+        finally:
+            stats.cancel()
+            self.sockets.discard(ws)
+        return ws
+
+    async def _send_stats(self, ws):
+        while not ws.closed:
+            await ws.send_json({
+                'op': 'stats', 'uptime': 1, 'players': len(self.players), 'playingPlayers': len(self.players),
+                'memory': {'free': 0, 'used': 0, 'allocated': 0, 'reservable': 0},
+                'cpu': {'cores': 4, 'systemLoad': self.cpu, 'lavalinkLoad': self.cpu},
+                'frameStats': {'sent': 3000 * len(self.players), 'nulled': 0, 'deficit': 0},
+            })
+            await asyncio.sleep(self.stats_interval)
+
+    async def loadtracks(self, request):
+        if request.headers.get('Authorization') != self.password:
+            raise web.HTTPUnauthorized()
+        self._count('loadtracks')
+        await asyncio.sleep(self.latency)
+        identifier = request.query['identifier']
+        if identifier.startswith('ytsearch:'):
+            terms = identifier[len('ytsearch:'):]
+            tracks = [make_track(f'{abs(hash(terms)) % 10 ** 8}-{i}', f'{terms} #{i}') for i in range(5)]
+            return web.json_response({'loadType': 'SEARCH_RESULT', 'playlistInfo': {}, 'tracks': tracks})
+        if '/playlist/' in identifier and 'spotify' not in identifier:
+            size = int(RSIZE.search(identifier).group(1))
+            tracks = [make_track(f'pl{size}-{i}', f'Playlist song {i}') for i in range(size)]
+            return web.json_response({'loadType': 'PLAYLIST_LOADED', 'tracks': tracks,
+                                      'playlistInfo': {'name': f'Playlist {size}', 'selectedTrack': -1}})
+        if '/fail/' in identifier:
+            return web.json_response({'loadType': 'LOAD_FAILED', 'playlistInfo': {}, 'tracks': [],
+                                      'exception': {'message': 'fake failure', 'severity': 'COMMON'}})
+        if 'spotify' in identifier:
+            return web.json_response({'loadType': 'NO_MATCHES', 'playlistInfo': {}, 'tracks': []})
+        track = make_track(identifier.rsplit('/', 1)[-1], f'Track {identifier}')
+        return web.json_response({'loadType': 'TRACK_LOADED', 'playlistInfo': {}, 'tracks': [track]})
+
+    @staticmethod
+    def _spotify_track(kind_id, index):
+        track_id = f'{kind_id}t{index}'
+        return {
+            'id': track_id, 'name': f'Song {index} of {kind_id}', 'duration_ms': 180000,
+            'artists': [{'name': f'Artist {index % 7}'}],
+            'album': {'artists': [{'name': f'Artist {index % 7}'}]},
+            'external_ids': {'isrc': f'FAKE{abs(hash(track_id)) % 10 ** 8:08d}'},
+        }
+
+    async def spotify_token(self, request):
+        self._count('spotify:token')
+        await asyncio.sleep(self.spotify_latency)
+        return web.json_response({'access_token': 'fake-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    async def spotify_track(self, request):
+        self._count('spotify:track')
+        await asyncio.sleep(self.spotify_latency)
+        return web.json_response(self._spotify_track(request.match_info['id'], 0))
+
+    async def spotify_tracks(self, request):
+        self._count('spotify:tracks')
+        await asyncio.sleep(self.spotify_latency)
+        tracks = []
+        for track_id in request.query['ids'].split(','):
+            kind_id, _, index = track_id.rpartition('t')
+            tracks.append(self._spotify_track(kind_id, int(index)))
+        return web.json_response({'tracks': tracks})
+
+    def _page(self, request, kind, collection_id, offset, limit):
+        size = int(RSIZE.search(collection_id).group(1))
+        items = []
+        for index in range(offset, min(offset + limit, size)):
+            track = self._spotify_track(collection_id, index)
+            if kind == 'albums':
+                del track['album'], track['external_ids']
+            items.append({'track': track} if kind == 'playlists' else track)
+        next_url = None
+        if offset + limit < size:
+            next_url = f'{self.spotify_url}/v1/{kind}/{collection_id}/tracks?offset={offset + limit}&limit={limit}'
+        return {'items': items, 'next': next_url, 'total': size, 'offset': offset, 'limit': limit}
+
+    async def spotify_collection(self, request):
+        kind = request.match_info['kind']
+        self._count(f'spotify:{kind}')
+        await asyncio.sleep(self.spotify_latency)
+        limit = 50 if kind == 'albums' else 100
+        return web.json_response({'tracks': self._page(request, kind, request.match_info['id'], 0, limit)})
+
+    async def spotify_page(self, request):
+        kind = request.match_info['kind']
+        self._count(f'spotify:{kind}:page')
+        await asyncio.sleep(self.spotify_latency)
+        return web.json_response(self._page(request, kind, request.match_info['id'],
+                                            int(request.query.get('offset', 0)), int(request.query.get('limit', 100))))
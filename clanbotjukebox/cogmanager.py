@@ -1,24 +1,75 @@
 import functools
+import logging
+import time
 from dotenv import load_dotenv
 
-import discord
 from discord.ext import commands
 from discord import option, Permissions
 
+import commandlog
+import metrics
 import settings
+import shards
+import startup
 
+_log = logging.getLogger(__name__)
 
-async def logCommand(channel, ctx, *args, **kwargs):
-    log_string = ":arrow_forward: Command:  "
-    log_string += ctx.channel.mention if isinstance(ctx.channel, discord.TextChannel) else "????"
-    log_string += f" | {ctx.author}: /{ctx.command} "
- 
-    for k, v in kwargs.items():
-        log_string += f" {k}: {v}"
-    await channel.send(log_string)
+
+def create_client():
+    """
+    Build the bot, sharded over the configured shards when sharding is enabled
+    :return: Bot or AutoShardedBot
+    """
+    if settings.DISCORD_SHARDED:
+        return commands.AutoShardedBot(command_prefix=commands.when_mentioned_or("!"), intents=settings.INTENTS,
+                                       member_cache_flags=settings.MEMBER_CACHE_FLAGS,
+                                       shard_count=settings.DISCORD_SHARD_COUNT, shard_ids=settings.DISCORD_SHARD_IDS)
+    return commands.Bot(command_prefix=commands.when_mentioned_or("!"), intents=settings.INTENTS,
+                        member_cache_flags=settings.MEMBER_CACHE_FLAGS)
+
+
+def shard_latencies():
+    latencies = client.latencies if settings.DISCORD_SHARDED else [(0, client.latency)]
+    return [((shard_id,), latency) for shard_id, latency in latencies]
+
+
+def shard_status():
+    if not settings.DISCORD_SHARDED:
+        return [((0,), int(client.is_ready() and not client.is_closed()))]
+    return [((shard_id,), int(not shard.is_closed())) for shard_id, shard in client.shards.items()]
+
+
+client = create_client()
+
+
+@client.event
+async def on_socket_event_type(event_type):
+    metrics.GATEWAY_EVENTS.inc(event=event_type)
+
+
+@client.event
+async def on_ready():
+    startup.phase('gateway_ready')
+
+
+@client.event
+async def on_shard_ready(shard_id):
+    _log.info("Shard %s ready, latency %.0f ms", shard_id, client.get_shard(shard_id).latency * 1000)
+    metrics.SHARD_EVENTS.inc(shard=shard_id, event='ready')
+
+
+@client.event
+async def on_shard_disconnect(shard_id):
+    _log.warning("Shard %s disconnected", shard_id)
+    metrics.SHARD_EVENTS.inc(shard=shard_id, event='disconnect')
+
+
+@client.event
+async def on_shard_resumed(shard_id):
+    _log.info("Shard %s resumed", shard_id)
+    metrics.SHARD_EVENTS.inc(shard=shard_id, event='resumed')
 
 
-client = commands.Bot(command_prefix=commands.when_mentioned_or("!"), intents=settings.INTENTS)
 @client.event
 async def on_command_error(ctx: commands.Context, error: commands.CommandError):
     """
@@ -52,14 +103,31 @@ def slashcommandlogger(func):
     @functools.wraps(func)
     async def wrapped(ctx, cog: str):
         # Some fancy foo stuff
-        await logCommand(client.get_channel(settings.DISCORD_LOG_CHANNEL), ctx, cog=cog.lower())
-        await func(ctx, cog)
+        commandlog.logCommand(client.get_channel(settings.DISCORD_LOG_CHANNEL), ctx, cog=cog.lower())
+        start = time.perf_counter()
+        try:
+            await func(ctx, cog)
+        finally:
+            metrics.COMMAND_LATENCY.observe(time.perf_counter() - start, command=func.__name__)
 
     return wrapped
 
 if __name__ == "__main__":
+    # The supervisor and every shard worker log their startup and shard events
+    logging.basicConfig(level=logging.INFO)
+    if settings.DISCORD_SHARD_PROCESSES > 1 and not settings.DISCORD_SHARD_IDS:
+        # Run as the supervisor of one bot process per slice of the shards
+        shards.supervise(__file__)
+        raise SystemExit
+
+    # Registered here so only the process that runs this client reports its shards
+    metrics.Gauge('jukebox_shard_latency_seconds', "Gateway heartbeat latency per shard", ['shard'],
+                  function=shard_latencies)
+    metrics.Gauge('jukebox_shard_up', "Whether a shard is connected", ['shard'], function=shard_status)
+
     # Load all cogs
     for cog in settings.DISCORD_COGS:
         client.load_extension(f'cogs.{cog.name}')
+    startup.phase('cogs_loaded')
 
     client.run(settings.DISCORD_TOKEN)
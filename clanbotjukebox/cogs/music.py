@@ -1,21 +1,46 @@
 import functools
 import asyncio
+import contextlib
+import io
+import json
+import logging
+import random
 import re
 import time
 from typing import Union
 
+import aiohttp
 import discord
 import lavalink
-import spotipy
-from discord import slash_command, Option
+from discord import slash_command, Option, SlashCommandGroup
 from discord.ext import commands
-from spotipy import SpotifyClientCredentials
 
-import cogmanager
+import commandlog
+import metrics
 import settings
+import shards
+import startup
+from listeners import ListenerIndex
+from nodepool import NodePool
+from nowplaying import NowPlaying
+from playeractor import PlayerActor
+from playhistory import PlayHistory
+from playlists import PlaylistError, PlaylistStore
+from queuestore import QueueStore
+from spotifymap import SpotifyTrackMap
+from spotifyresolver import SpotifyError, SpotifyResolver
+from trackcache import TrackCache
+from trackqueue import TrackQueue
+from trackresolver import LazyTrack, TrackResolver
+
+_log = logging.getLogger(__name__)
 
 RURL = re.compile(r'https?://(?:www\.)?.+')
-sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=settings.DISCORD_SPOTIFY_CLIENT_ID, client_secret=settings.DISCORD_SPOTIFY_CLIENT_TOKEN))
+# Number of imported songs sent to the player in one add once playback has started
+IMPORT_BATCH = 50
+# Largest playlist file /playlist import accepts, in bytes
+PLAYLIST_FILE_SIZE = 2 * 1024 * 1024
+sp = SpotifyResolver(client_id=settings.DISCORD_SPOTIFY_CLIENT_ID, client_secret=settings.DISCORD_SPOTIFY_CLIENT_TOKEN)
 
 def slashcommandlogger(func):
     """
@@ -27,9 +52,13 @@ def slashcommandlogger(func):
     @functools.wraps(func)
     async def wrapped(self, ctx, *args, **kwargs):
         # Some fancy foo stuff
-        await func(self, ctx, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            await func(self, ctx, *args, **kwargs)
+        finally:
+            metrics.COMMAND_LATENCY.observe(time.perf_counter() - start, command=func.__name__)
         logChannel = self.client.get_channel(settings.DISCORD_LOG_CHANNEL)
-        await cogmanager.logCommand(logChannel, ctx, **kwargs)
+        commandlog.logCommand(logChannel, ctx, **kwargs)
 
     return wrapped
 
@@ -37,7 +66,9 @@ def slashcommandlogger(func):
 def create_embed(guild, track, position):
     pos = time.strftime('%H:%M:%S', time.gmtime(int(position / 1000)))
     dur = time.strftime('%H:%M:%S', time.gmtime(int(track.duration / 1000)))
-    requester = guild.get_member(track.requester).display_name
+    member = guild.get_member(track.requester)
+    # Members outside voice channels are not cached without the members intent
+    requester = member.display_name if member else track.extra.get('requester_name', "unknown user")
     embed = discord.Embed(title=f"{track.title}", description=f"*{track.author}*", color=discord.Color.light_gray())
     embed.add_field(name="__Position__", value=f"{pos}/{dur}", inline=True)
     embed.add_field(name="__Video URL__", value=f"[Click here!]({track.uri})", inline=False)
@@ -45,6 +76,12 @@ def create_embed(guild, track, position):
     return embed
 
 
+def format_duration(milliseconds):
+    hours, remainder = divmod(int(milliseconds / 1000), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d} hours, {minutes:02d} minutes, {seconds:02d} seconds"
+
+
 def confirmation(message):
     embed = discord.Embed(title=f"{message}", color=discord.Color.green())
     return embed
@@ -53,6 +90,8 @@ def confirmation(message):
 async def cleanup(player):
     player.queue.clear()
     await player.stop()
+    if player.queue_store is not None:
+        player.queue_store.forget(player.guild_id)
 
 
 class Player(discord.VoiceClient):
@@ -86,6 +125,176 @@ class Player(discord.VoiceClient):
         self.cleanup()
 
 
+class JukeboxPlayer(lavalink.DefaultPlayer):
+    """
+    Lavalink player that mirrors its queue and settings into the queue store so it can be restored after a restart
+    """
+    queue_store = None
+
+    def __init__(self, guild_id, node):
+        super().__init__(guild_id, node)
+        self.queue = TrackQueue()
+        self.actor = PlayerActor(self)
+        # Queue entries drawn ahead of time to play next while shuffling, so they can be prefetched
+        self.upcoming = []
+        self._prefetching = set()
+
+    def _track_entry(self, index):
+        track = self.queue[index]
+        before = self.queue[index - 1].extra.get('seq') if index > 0 else None
+        after = self.queue[index + 1].extra.get('seq') if index + 1 < len(self.queue) else None
+        if before is not None and after is not None:
+            seq = (before + after) / 2
+        elif before is not None:
+            seq = before + 1
+        elif after is not None:
+            seq = after - 1
+        else:
+            seq = 0
+        track.extra['entry_id'] = entry_id = self.queue_store.next_id()
+        track.extra['seq'] = seq
+        meta = track.to_dict() if isinstance(track, LazyTrack) else {}
+        if 'requester_name' in track.extra:
+            meta['requester_name'] = track.extra['requester_name']
+        self.queue_store.enqueue(self.guild_id, entry_id, seq, track.track, track.requester,
+                                 json.dumps(meta) if meta else None)
+
+    def add(self, track, requester=0, index=None, requester_name=None):
+        """
+        Add a track, snapshotting the requester's name so the member does not have to stay cached
+        :param requester_name: display name of the requester
+        """
+        super().add(track, requester=requester, index=index)
+        index = len(self.queue) - 1 if index is None else min(index, len(self.queue) - 1)
+        if requester_name is not None:
+            self.queue[index].extra['requester_name'] = requester_name
+        if self.queue_store is not None:
+            self._track_entry(index)
+
+    def add_many(self, tracks, requester=0, requester_name=None):
+        """
+        Append several tracks in one go
+        :param tracks: AudioTracks or track dicts
+        """
+        tracks = [lavalink.AudioTrack(track, requester) if isinstance(track, dict) else track for track in tracks]
+        start = len(self.queue)
+        for track in tracks:
+            if requester != 0:
+                track.requester = requester
+            if requester_name is not None:
+                track.extra['requester_name'] = requester_name
+        self.queue.extend(tracks)
+        if self.queue_store is not None:
+            for index in range(start, len(self.queue)):
+                self._track_entry(index)
+
+    async def change_node(self, node):
+        if isinstance(self.current, LazyTrack):
+            self.current.node = node
+        await super().change_node(node)
+
+    async def node_unavailable(self):
+        # The position only advances on player updates once the node is gone, keep the time played since the last one
+        self._last_position = self.position
+        await super().node_unavailable()
+
+    def _upcoming(self, window):
+        """
+        Draw the songs that play next while shuffling, at random from the whole queue
+        :param window: number of songs to draw ahead
+        :return: the next songs in the order they will play
+        """
+        queued = {id(track) for track in self.queue}
+        self.upcoming = [track for track in self.upcoming if id(track) in queued]
+        if len(self.upcoming) < window:
+            drawn = {id(track) for track in self.upcoming}
+            rest = [track for track in self.queue if id(track) not in drawn]
+            self.upcoming += random.sample(rest, min(window - len(self.upcoming), len(rest)))
+        return self.upcoming[:window]
+
+    def _shuffled(self):
+        track = self._upcoming(1)[0]
+        self.upcoming.pop(0)
+        return self.queue.pop(next(index for index, queued in enumerate(self.queue) if queued is track))
+
+    async def play(self, track=None, *args, **kwargs):
+        before = {queued.extra.get('entry_id') for queued in self.queue} if self.queue_store is not None else None
+        if track is None and self.loop != 1 and self.queue:
+            track = self._shuffled() if self.shuffle else self.queue.pop(0)
+        if isinstance(track, LazyTrack):
+            track.node = self.node
+        await super().play(track, *args, **kwargs)
+        if self.queue_store is None:
+            return
+        # Diff the queue, play() pops the next track and looping puts tracks back without going through add()
+        kept = set()
+        for index, queued in enumerate(self.queue):
+            entry_id = queued.extra.get('entry_id')
+            if entry_id in before and entry_id not in kept:
+                kept.add(entry_id)
+            else:
+                self._track_entry(index)
+        self.queue_store.remove(before - kept)
+        if self.current is not None or self.queue:
+            self.queue_store.save_player(self)
+
+    def prefetch(self, window=None):
+        """
+        Search for the lazy entries that play next in the background
+        :param window: number of upcoming entries to resolve, defaults to the prefetch window setting
+        """
+        window = window or settings.DISCORD_PREFETCH_WINDOW
+        upcoming = self._upcoming(window) if self.shuffle and self.loop != 1 else self.queue[:window]
+        for track in upcoming:
+            if isinstance(track, LazyTrack) and not track.resolved:
+                # Keep a reference, the loop only holds weak ones and could collect the task mid-search
+                task = asyncio.ensure_future(self._prefetch(track))
+                self._prefetching.add(task)
+                task.add_done_callback(self._prefetching.discard)
+
+    async def _prefetch(self, track):
+        try:
+            await track.resolve(self.node)
+        except lavalink.LoadError as e:
+            # Tried again when the entry is played, a failure there skips it
+            _log.debug("Prefetch failed: %s", e)
+            return
+        if self.queue_store is not None and 'entry_id' in track.extra:
+            self.queue_store.resolve(track.extra['entry_id'], track.track)
+
+    def set_loop(self, loop: int):
+        super().set_loop(loop)
+        if self.queue_store is not None:
+            self.queue_store.save_player(self)
+
+    def set_repeat(self, repeat: bool):
+        self.set_loop(2 if repeat else 0)
+
+    def set_shuffle(self, shuffle: bool):
+        super().set_shuffle(shuffle)
+        self.upcoming = []
+        if shuffle:
+            self.prefetch()
+        if self.queue_store is not None:
+            self.queue_store.save_player(self)
+
+    async def set_pause(self, pause: bool):
+        await super().set_pause(pause)
+        if self.queue_store is not None:
+            self.queue_store.save_player(self)
+
+    async def set_volume(self, vol: int):
+        await super().set_volume(vol)
+        if self.queue_store is not None:
+            self.queue_store.save_player(self)
+
+    async def _voice_state_update(self, data):
+        channel_id = self.channel_id
+        await super()._voice_state_update(data)
+        if self.queue_store is not None and self.channel_id != channel_id and self.channel_id:
+            self.queue_store.save_player(self)
+
+
 class SongSelect(discord.ui.Select):
     def __init__(self, client, tracks, requester):
         self.client = client
@@ -107,36 +316,34 @@ class SongSelect(discord.ui.Select):
         info = song['info']
         await interaction.response.edit_message(embed=confirmation(f"Adding {info['title']} to the player"), view=None)
         player = self.client.lavalink.player_manager.get(interaction.guild.id)
-        player.add(track=song, requester=self.requester.id)
         self.view.stop()
-        if not player.is_playing:
-            await player.play()
+        await player.actor.add([song], requester=self.requester.id, requester_name=self.requester.display_name)
 
 
 class Queue(discord.ui.View):
 
-    def __init__(self, client, queue, length):
+    def __init__(self, client, queue):
         super().__init__()
         self.client = client
         self.queue = queue
-        self.length = length
         self.position = 0
-        self.max = len(queue[::10]) - 1
+
+    @property
+    def max(self):
+        return self.queue.pages()
 
     def build_queue(self):
         page = 10 * self.position
         songlist = []
-        count = 1
-        for song in self.queue[page:page + 10]:
-            songlist.append(f"**{count + page}:** `{song}`")
-            count += 1
+        for count, song in enumerate(self.queue.page(self.position), start=page + 1):
+            songlist.append(f"**{count}:** `{song.title}`")
         embed = discord.Embed(title="Upcoming Songs", description=f"\n".join(songlist), color=discord.Color.blurple())
-        embed.set_footer(text=f"{(10 * self.position - 1) + count} of {len(self.queue)} songs - {self.length}")
+        embed.set_footer(text=f"{page + len(songlist)} of {len(self.queue)} songs - {format_duration(self.queue.duration)}")
         return embed
 
     @discord.ui.button(label="Previous 10", style=discord.ButtonStyle.gray)
     async def queue_prev(self, button: discord.ui.Button, interaction: discord.Interaction):
-        self.position -= 1
+        self.position = max(min(self.position - 1, self.max), 0)
         if self.position == 0:
             button.disabled = True
         if self.children[2].disabled:
@@ -159,7 +366,7 @@ class Queue(discord.ui.View):
 
     @discord.ui.button(label="Next 10", style=discord.ButtonStyle.gray)
     async def queue_next(self, button: discord.ui.Button, interaction: discord.Interaction):
-        self.position += 1
+        self.position = min(self.position + 1, self.max)
         if self.position == self.max:
             button.disabled = True
         if self.children[0].disabled:
@@ -178,84 +385,81 @@ class Buttons(discord.ui.View):
         player = self.client.lavalink.player_manager.get(interaction.guild.id)
         return player
 
-    @staticmethod
-    def compilequeue(queue):
-        titles = []
-        lengths = []
-        for song in queue:
-            titles.append(song.title)
-            lengths.append(int(song.duration / 1000))
-        return titles, lengths
+    def announce(self, interaction, action):
+        """
+        Show what the user did on the guild's now playing message, which is updated in the background
+        :param interaction: button interaction
+        :param action: what the user did, e.g. "paused the music"
+        """
+        nowplaying = self.client.nowplaying
+        if interaction.guild.id not in nowplaying.panels:
+            nowplaying.bind(interaction.guild.id, interaction.channel)
+        nowplaying.announce(interaction.guild.id, f"{interaction.user.display_name} {action}")
 
     @discord.ui.button(emoji="⏯️", label="Play/Pause", style=discord.ButtonStyle.gray, row=1)
+    @metrics.timed(metrics.BUTTON_LATENCY, button='pauseplay')
     async def button_pauseplay(self, button: discord.ui.Button, interaction: discord.Interaction):
         player = self.controller(interaction)
-        embed = create_embed(guild=interaction.guild, track=player.current, position=player.position)
+        await interaction.response.defer()
         if not player.paused:
             await player.set_pause(pause=True)
-            await interaction.response.edit_message(embed=embed, view=self)
-            await interaction.channel.send(f"{interaction.user.display_name} paused the music")
+            self.announce(interaction, "paused the music")
         else:
             await player.set_pause(pause=False)
-            await interaction.response.edit_message(embed=embed, view=self)
-            await interaction.channel.send(f"{interaction.user.display_name} resumed the music")
+            self.announce(interaction, "resumed the music")
 
     @discord.ui.button(emoji="⏩", label="Skip", style=discord.ButtonStyle.gray, row=1)
+    @metrics.timed(metrics.BUTTON_LATENCY, button='forward')
     async def button_forward(self, button: discord.ui.Button, interaction: discord.Interaction):
         player = self.controller(interaction)
-        embed = create_embed(guild=interaction.guild, track=player.current, position=player.position)
-        await player.skip()
-        await interaction.response.edit_message(embed=embed, view=self)
-        await interaction.channel.send(f"{interaction.user.display_name} skipped the song")
+        await interaction.response.defer()
+        await player.actor.call(JukeboxPlayer.skip)
+        self.announce(interaction, "skipped the song")
 
     @discord.ui.button(emoji="⏹️", label="Stop", style=discord.ButtonStyle.gray, row=1)
+    @metrics.timed(metrics.BUTTON_LATENCY, button='stop')
     async def button_stop(self, button: discord.ui.Button, interaction: discord.Interaction):
         player = self.controller(interaction)
         embed = discord.Embed(title=f"Stopping player...", color=discord.Color.red())
         voice = interaction.guild.voice_client
         await interaction.response.edit_message(embed=embed, view=None)
-        await interaction.channel.send(f"{interaction.user.display_name} stopped the player")
+        self.announce(interaction, "stopped the player")
+        self.client.nowplaying.close(interaction.guild.id)
         if voice:
             await voice.disconnect(force=True)
-        await cleanup(player)
+        await player.actor.call(cleanup)
 
     @discord.ui.button(emoji="🔀", label="Shuffle", style=discord.ButtonStyle.gray, row=2)
+    @metrics.timed(metrics.BUTTON_LATENCY, button='shuffle')
     async def button_shuffle(self, button: discord.ui.Button, interaction: discord.Interaction):
         player = self.controller(interaction)
-        embed = create_embed(guild=interaction.guild, track=player.current, position=player.position)
-        await interaction.response.edit_message(embed=embed, view=self)
+        await interaction.response.defer()
         if not player.shuffle:
             player.set_shuffle(shuffle=True)
-            await interaction.channel.send(f"{interaction.user.display_name} shuffling the queue!")
+            self.announce(interaction, "shuffling the queue!")
         else:
             player.set_shuffle(shuffle=False)
-            await interaction.channel.send(f"{interaction.user.display_name} no longer shuffling the queue!")
+            self.announce(interaction, "no longer shuffling the queue!")
 
     @discord.ui.button(emoji="🔁", label="Repeat", style=discord.ButtonStyle.gray, row=2)
+    @metrics.timed(metrics.BUTTON_LATENCY, button='loop')
     async def button_loop(self, button: discord.ui.Button, interaction: discord.Interaction):
         player = self.controller(interaction)
-        embed = create_embed(guild=interaction.guild, track=player.current, position=player.position)
-        await interaction.response.edit_message(embed=embed, view=self)
+        await interaction.response.defer()
         if not player.repeat:
             player.set_repeat(repeat=True)
-            await interaction.channel.send(f"{interaction.user.display_name} looping the queue!")
+            self.announce(interaction, "looping the queue!")
         else:
             player.set_repeat(repeat=False)
-            await interaction.channel.send(f"{interaction.user.display_name} no longer looping the queue!")
+            self.announce(interaction, "no longer looping the queue!")
 
     @discord.ui.button(emoji="⏏️", label="Queue", style=discord.ButtonStyle.gray, row=2)
+    @metrics.timed(metrics.BUTTON_LATENCY, button='queue')
     async def button_queue(self, button: discord.ui.Button, interaction: discord.Interaction):
         player = self.controller(interaction)
-        queue, length = self.compilequeue(player.queue)
-        songlist = []
-        for idx, song in enumerate(queue[:10]):
-            songlist.append(f"**{idx + 1}:** `{song}`")
-        totallength = time.strftime('%H hours, %M minutes, %S seconds', time.gmtime(sum(length)))
-        embed = discord.Embed(title="Upcoming Songs", description=f"\n".join(songlist),
-                              color=discord.Color.light_gray())
-        embed.set_footer(text=f"10 of {len(queue)} songs - {totallength}")
-        view = Queue(self.client, queue, totallength)
-        ex = view.children[1:] if len(queue) > 10 else view.children[1:2]
+        view = Queue(self.client, player.queue)
+        embed = view.build_queue()
+        ex = view.children[1:] if len(player.queue) > 10 else view.children[1:2]
         view.disable_all_items(exclusions=ex)
         await interaction.response.edit_message(embed=embed, view=view)
 
@@ -265,109 +469,441 @@ class Music(commands.Cog):
     def __init__(self, client):
         self.client = client
         self.client.lavalink = None
-        client.loop.create_task(self.connect_nodes())
+        self.nodes = None
+        self.ready = startup.Readiness()
+        self.store = QueueStore() if settings.DISCORD_QUEUE_STORE_PATH else None
+        JukeboxPlayer.queue_store = self.store
+        self.cache = TrackCache()
+        self.history = PlayHistory()
+        self.playlists = PlaylistStore()
+        self.spotify_map = SpotifyTrackMap()
+        self.resolver = TrackResolver(cache=self.cache, mapping=self.spotify_map)
+        LazyTrack.resolver = self.resolver
+        self.client.nowplaying = NowPlaying(client, self.now_playing_embed)
+        self.listeners = ListenerIndex(client)
+        self.idle = {}
+        self.idle_paused = set()
+        metrics.Gauge('jukebox_players', "Players per Lavalink node", ['node', 'state'], function=self.player_counts)
+        metrics.Gauge('jukebox_queue_length', "Queued songs per guild", ['guild'], function=self.queue_lengths)
+        metrics.Gauge('jukebox_track_cache', "Track cache counters", ['counter'],
+                      function=lambda: (((key,), value) for key, value in self.cache.stats.items()))
+        client.loop.create_task(self.start())
+        if settings.DISCORD_METRICS_PORT:
+            client.loop.create_task(metrics.serve())
+            client.loop.create_task(metrics.monitor_event_loop())
+
+    async def start(self):
+        """
+        Connect to Lavalink and fetch a Spotify token while the gateway logs in, then open the readiness gate
+        """
+        try:
+            await asyncio.gather(self.connect_nodes(), self.warm_spotify())
+        except Exception:
+            # Commands are better off failing on their own than waiting on a gate that never opens
+            _log.exception("Startup failed, opening the readiness gate anyway")
+        finally:
+            self.ready.set()
+            startup.phase('ready')
+
+    async def warm_spotify(self):
+        if not settings.DISCORD_SPOTIFY_CLIENT_ID:
+            return
+        try:
+            await sp.token()
+        except (SpotifyError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _log.warning("Could not fetch a Spotify token during startup: %s", e)
+            return
+        startup.phase('spotify')
 
     async def connect_nodes(self):
-        await self.client.wait_until_ready()
-        lavaclient = lavalink.Client(self.client.user.id)
-        lavaclient.add_node(host=settings.DISCORD_LAVALINK_HOST, port=settings.DISCORD_LAVALINK_PORT, password=settings.DISCORD_LAVALINK_PASSWORD, region=settings.DISCORD_LAVALINK_REGION)
+        # The user id is in the token, only wait for the gateway when the token cannot be read
+        user_id = startup.user_id_from_token(settings.DISCORD_TOKEN)
+        if user_id is None:
+            await self.client.wait_until_ready()
+            user_id = self.client.user.id
+        lavaclient = lavalink.Client(user_id, player=JukeboxPlayer)
+        self.nodes = NodePool(lavaclient)
         lavaclient.add_event_hooks(self)
         self.client.lavalink = lavaclient
+        self.client.loop.create_task(self.nodes.monitor())
+        for _ in range(300):
+            if lavaclient.node_manager.available_nodes:
+                startup.phase('lavalink')
+                break
+            await asyncio.sleep(0.1)
+        if self.store is not None:
+            # Restoring needs the guilds and channels from the gateway
+            await self.client.wait_until_ready()
+            try:
+                await self.restore_players()
+            finally:
+                # Keep saving the queues of new players even when the old ones could not be restored
+                self.client.loop.create_task(self.store.run(lavaclient.player_manager.values))
+            startup.phase('restore')
+
+    async def restore_players(self):
+        """
+        Rebuild the players that were active before the restart from their stored snapshot,
+        without searching for any track again
+        """
+        for guild_id, snapshot in (await self.store.load()).items():
+            if not shards.owns_guild(self.client, guild_id):
+                continue  # Restored by the worker process that runs the guild's shard
+            guild = self.client.get_guild(guild_id)
+            channel = guild.get_channel(snapshot['channel_id']) if guild and snapshot['channel_id'] else None
+            if channel is None or not (snapshot['current'] or snapshot['queue']):
+                self.store.forget(guild_id)
+                continue
+            try:
+                await self.restore_player(channel, snapshot)
+            except Exception:
+                _log.exception("Failed to restore the player of guild %s", guild_id)
+                self.store.forget(guild_id)
+        await self.store.flush()
+
+    async def restore_player(self, channel, snapshot):
+        player = self.nodes.create_player(channel.guild.id)
+        for entry_id, seq, encoded, requester, meta in snapshot['queue']:
+            meta = json.loads(meta) if meta else {}
+            if 'query' in meta:
+                track = LazyTrack.from_dict(meta, requester)
+                track.track = encoded
+            else:
+                track = lavalink.decode_track(encoded)
+                track.requester = requester
+            if 'requester_name' in meta:
+                track.extra['requester_name'] = meta['requester_name']
+            track.extra.update(entry_id=entry_id, seq=seq)
+            player.queue.append(track)
+        player.shuffle = snapshot['shuffle']
+        player.loop = snapshot['loop']
+        await channel.connect(cls=Player)
+        self.listeners.reset(channel.guild.id, channel)
+        if snapshot['current']:
+            current = lavalink.decode_track(snapshot['current'])
+            current.requester = snapshot['current_requester']
+            position = snapshot['position'] if snapshot['position'] < current.duration else 0
+            await player.play(current, start_time=position, volume=snapshot['volume'], pause=snapshot['paused'])
+        else:
+            await player.play(volume=snapshot['volume'])
+
+    def cog_unload(self):
+        self.client.nowplaying.stop()
+        for task in self.idle.values():
+            task.cancel()
+        self.client.loop.create_task(sp.close())
+        self.cache.close()
+        self.history.close()
+        self.playlists.close()
+        self.spotify_map.close()
+        if self.store is not None:
+            self.store.close()
 
     @lavalink.listener(lavalink.events.QueueEndEvent)
     async def queue_ending(self, event: lavalink.QueueEndEvent):
         guild_id = event.player.guild_id
         guild = self.client.get_guild(guild_id)
+        if event.player.queue_store is not None:
+            event.player.queue_store.forget(guild_id)
+        self.client.nowplaying.close(guild_id)
+        self.stop_idle(guild_id)
         await guild.voice_client.disconnect(force=True)
 
+    @staticmethod
+    def now_playing_embed(guild, player):
+        return create_embed(guild=guild, track=player.current, position=player.position)
+
+    @lavalink.listener(lavalink.events.TrackStartEvent)
+    async def track_started(self, event: lavalink.TrackStartEvent):
+        self.client.nowplaying.refresh(event.player.guild_id)
+        await self.history.record(event.player.guild_id, event.track)
+
+    @lavalink.listener(lavalink.events.TrackStartEvent, lavalink.events.TrackEndEvent)
+    async def prefetch(self, event):
+        event.player.prefetch()
+
+    @lavalink.listener(lavalink.events.TrackLoadFailedEvent)
+    async def track_load_failed(self, event: lavalink.TrackLoadFailedEvent):
+        _log.warning("Skipping %s in guild %s: %s", event.track.title, event.player.guild_id, event.original)
+        # Drop the failed entry so looping does not put it back into the queue
+        event.player.current = None
+        # Runs inside the play() that failed, which may be the player's actor, so it must not wait on the actor
+        await event.player.skip()
+
+    def player_counts(self):
+        if self.client.lavalink is None:
+            return []
+        counts = {}
+        for node in self.client.lavalink.node_manager:
+            counts[(node.name, 'connected')] = 0
+            counts[(node.name, 'playing')] = 0
+        for player in self.client.lavalink.player_manager.values():
+            counts[(player.node.name, 'connected')] = counts.get((player.node.name, 'connected'), 0) + 1
+            if player.is_playing:
+                counts[(player.node.name, 'playing')] = counts.get((player.node.name, 'playing'), 0) + 1
+        return counts.items()
+
+    def queue_lengths(self):
+        if self.client.lavalink is None:
+            return []
+        return [((player.guild_id,), len(player.queue)) for player in self.client.lavalink.player_manager.values()]
+
+    @lavalink.listener()
+    async def count_events(self, event: lavalink.Event):
+        metrics.LAVALINK_EVENTS.inc(event=type(event).__name__)
+
+    @lavalink.listener(lavalink.events.NodeDisconnectedEvent)
+    async def node_disconnected(self, event: lavalink.NodeDisconnectedEvent):
+        await self.nodes.failover(event.node)
+
     @staticmethod
     def is_privileged(user, track):
         return track.requester == user.id or user.guild_permissions.kick_members
 
+    def stream_spotify_tracks(self, player, query):
+        """
+        Turn a Spotify link into Lavalink tracks one page at a time, songs matched before are not searched again
+        :param player: player whose node performs the searches
+        :param query: Spotify URL or URI
+        :return: async generator of Resolved tuples, in playlist order
+        """
+        return self.resolver.resolve(player.node, sp.iter_songs(query, known=self.spotify_map.known))
+
     @staticmethod
-    def get_spotify_tracks(query):  # spotify you suck this took so long to figure out
-        songlist = []
-        match re.findall(r'/track/|/album/|/playlist/', query)[0]:
-            case '/track/':
-                track = sp.track(query)
-                songlist.append(f"{track['album']['artists'][0]['name']} - {track['name']}")
-            case '/album/':
-                tracks = sp.album(query)
-                for track in tracks['tracks']['items']:
-                    songlist.append(f"{track['artists'][0]['name']} - {track['name']}")
-            case '/playlist/':
-                tracks = sp.playlist(query)
-                for track in tracks['tracks']['items']:
-                    actualtrack = track['track']  # why
-                    songlist.append(f"{actualtrack['album']['artists'][0]['name']} - {actualtrack['name']}")
-            case _:
-                pass
-        return songlist
+    async def queue_batch(ctx, player, pending, started):
+        """
+        Send buffered import songs to the player's actor in one add
+        :return: whether all of them fit in the queue
+        """
+        added = await player.actor.add(pending, requester=ctx.author.id, requester_name=ctx.author.display_name,
+                                       started=started)
+        full = added < len(pending)
+        del pending[added:]
+        return not full
+
+    async def import_spotify_tracks(self, ctx, player, search, started):
+        """
+        Search for every song of a Spotify link before queueing it
+        :return: number of songs added and the Resolved results that failed
+        """
+        count = 0
+        failed = []
+        pending = []
+        last_update = time.monotonic()
+        async with contextlib.aclosing(self.stream_spotify_tracks(player, search)) as results:
+            async for result in results:
+                if result.error:
+                    failed.append(result)
+                    continue
+                pending.append(result.track)
+                # Queue right away while nothing plays, otherwise in batches
+                if len(pending) >= IMPORT_BATCH or not player.is_playing:
+                    fits = await self.queue_batch(ctx, player, pending, started)
+                    count += len(pending)
+                    pending.clear()
+                    if not fits:
+                        break
+                if time.monotonic() - last_update >= settings.DISCORD_IMPORT_PROGRESS_INTERVAL:
+                    last_update = time.monotonic()
+                    await ctx.edit(embed=confirmation(f"Imported {count} spotify song(s) so far..."))
+        if pending:
+            await self.queue_batch(ctx, player, pending, started)
+            count += len(pending)
+        return count, failed
+
+    async def queue_spotify_songs(self, ctx, player, search, started):
+        """
+        Queue the songs of a Spotify link as lazy entries, only the prefetch window is searched for right away
+        :return: number of songs added and an empty list, failures are skipped when the song comes up
+        """
+        count = 0
+        pending = []
+        last_update = time.monotonic()
+        async with contextlib.aclosing(sp.iter_songs(search, known=self.spotify_map.known)) as songs:
+            async for song in songs:
+                pending.append(LazyTrack.from_song(song, ctx.author.id))
+                if len(pending) >= IMPORT_BATCH or not player.is_playing:
+                    fits = await self.queue_batch(ctx, player, pending, started)
+                    count += len(pending)
+                    pending.clear()
+                    if not fits:
+                        break
+                if time.monotonic() - last_update >= settings.DISCORD_IMPORT_PROGRESS_INTERVAL:
+                    last_update = time.monotonic()
+                    await ctx.edit(embed=confirmation(f"Imported {count} spotify song(s) so far..."))
+        if pending:
+            await self.queue_batch(ctx, player, pending, started)
+            count += len(pending)
+        player.prefetch()
+        return count, []
+
+    async def listeners_changed(self, guild, player, count):
+        """
+        Pause the player when the last listener leaves and resume it when someone comes back
+        :param guild: guild
+        :param player: the guild's player
+        :param count: number of listeners in the bot's voice channel
+        """
+        if count:
+            if self.stop_idle(guild.id) and player is not None and player.paused:
+                await player.set_pause(False)
+                self.client.nowplaying.announce(guild.id, "Resumed, welcome back")
+        elif guild.id not in self.idle:
+            if not settings.DISCORD_IDLE_TIMEOUT:
+                return await self.leave(guild, player)
+            if player is not None and player.is_playing and not player.paused:
+                await player.set_pause(True)
+                self.idle_paused.add(guild.id)
+                self.client.nowplaying.announce(guild.id, "Paused until someone joins the voice channel")
+            self.idle[guild.id] = self.client.loop.create_task(self.idle_timeout(guild, player))
+
+    def stop_idle(self, guild_id):
+        """
+        Cancel the idle timer of a guild
+        :param guild_id: guild id
+        :return: whether the player was paused because nobody was listening
+        """
+        task = self.idle.pop(guild_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        paused = guild_id in self.idle_paused
+        self.idle_paused.discard(guild_id)
+        return paused
+
+    async def idle_timeout(self, guild, player):
+        await asyncio.sleep(settings.DISCORD_IDLE_TIMEOUT)
+        await self.leave(guild, player)
+
+    async def leave(self, guild, player):
+        self.stop_idle(guild.id)
+        self.listeners.forget(guild.id)
+        if player is not None and player.is_playing:
+            await player.actor.call(cleanup)
+        self.client.nowplaying.close(guild.id)
+        if guild.voice_client is not None:
+            await guild.voice_client.disconnect(force=True)
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState,
                                     after: discord.VoiceState):
-        voice = discord.utils.get(self.client.voice_clients, guild=member.guild)
-        player = self.client.lavalink.player_manager.get(member.guild.id)
-        if not voice:
-            if player:
-                await cleanup(player)
-            return
-        elif voice.channel != before.channel:  # ignore if the member joined a voice channel
+        guild = member.guild
+        if self.client.lavalink is None:
+            return  # Still starting, the listeners are counted when the bot joins a channel
+        player = self.client.lavalink.player_manager.get(guild.id)
+        if member.id == self.client.user.id:
+            # The bot joined, moved or left, count the listeners of its new channel once
+            if after.channel is None:
+                self.stop_idle(guild.id)
+                self.listeners.forget(guild.id)
+            elif after.channel != before.channel:
+                await self.listeners_changed(guild, player, self.listeners.reset(guild.id, after.channel))
             return
-        elif member.bot:
+        if guild.voice_client is None:
+            if player and (player.current is not None or player.queue):
+                await player.actor.call(cleanup)
             return
-        if after.channel != before.channel:
-            memberlist = []
-            for m in before.channel.members:
-                if m.bot:
-                    continue
-                memberlist.append(m)
-            if not memberlist:
-                if player.is_playing:
-                    await cleanup(player)
-                await voice.disconnect(force=True)
+        count = self.listeners.update(member, before, after)
+        if count is not None:
+            await self.listeners_changed(guild, player, count)
 
-    @slash_command(description="Play some music")
-    @commands.cooldown(1, 5, commands.BucketType.user)
-    @slashcommandlogger
-    async def music(self, ctx, search: Option(str, description="Music query or URL", required=False, default=None)):
+    async def join(self, ctx):
+        """
+        Connect to the command author's voice channel, or move there
+        :param ctx: command context
+        :return: the guild's player, None when the command cannot go ahead
+        """
         try:
             channel = ctx.author.voice.channel
         except AttributeError:
-            return await ctx.respond("You need to be in a voice channel", ephemeral=True)
-        player = self.client.lavalink.player_manager.create(ctx.guild.id)
+            await ctx.respond("You need to be in a voice channel", ephemeral=True)
+            return None
+        if not await self.wait_ready(ctx):
+            return None
+        player = self.nodes.create_player(ctx.guild.id)
         try:
             await channel.connect(cls=Player)
         except discord.ClientException:
             await ctx.guild.voice_client.move_to(channel)
+        await self.listeners_changed(ctx.guild, player, self.listeners.reset(ctx.guild.id, channel))
+        return player
+
+    async def wait_ready(self, ctx):
+        """
+        Hold a command that arrives before Lavalink is connected instead of failing it
+        :param ctx: command context
+        :return: whether the command can go ahead
+        """
+        if self.ready.is_set():
+            return True
+        await ctx.defer()
+        if await self.ready.wait(settings.DISCORD_STARTUP_WAIT):
+            return True
+        # The first follow-up to a public defer replaces it and stays public, remove it to answer privately
+        await ctx.delete()
+        await ctx.respond("The jukebox is still starting up, please try again in a moment", ephemeral=True)
+        return False
+
+    async def search_suggestions(self, ctx: discord.AutocompleteContext):
+        """
+        Suggest songs the guild played before while the search is being typed
+        :param ctx: autocomplete context
+        :return: choices whose value queues the stored track
+        """
+        started = time.perf_counter()
+        entries = self.history.suggest(ctx.interaction.guild_id, ctx.value or '')
+        metrics.MUSIC_STAGE_LATENCY.observe(time.perf_counter() - started, stage='autocomplete')
+        return [discord.OptionChoice(name=entry.label, value=f'history:{entry.id}') for entry in entries]
+
+    async def queue_history(self, ctx, player, search, started):
+        """
+        Queue a song picked from the search suggestions, the stored track is played without searching again
+        :param search: value of the picked suggestion
+        :param started: perf_counter when the command started
+        """
+        entry_id = search.partition(':')[2]
+        entry = self.history.get(ctx.guild.id, int(entry_id)) if entry_id.isdigit() else None
+        if entry is None:
+            return await ctx.respond("That suggestion is no longer available, please search again", ephemeral=True)
+        track = lavalink.decode_track(entry.track)
+        await ctx.respond(embed=confirmation(f"Adding {track.title} to the player"))
+        await player.actor.add([track], requester=ctx.author.id, requester_name=ctx.author.display_name,
+                               started=started)
+
+    @slash_command(description="Play some music")
+    @commands.cooldown(1, 5, commands.BucketType.user)
+    @slashcommandlogger
+    async def music(self, ctx, search: Option(str, description="Music query or URL", required=False, default=None,
+                                              autocomplete=search_suggestions)):
+        started = time.perf_counter()
+        player = await self.join(ctx)
+        if player is None:
+            return
         if search:
             if len(search) > 256:
                 return await ctx.respond("Search query has a maximum of 256 characters!", ephemeral=True)
             elif player.is_playing:
-                if len(player.queue) >= 250:
+                if len(player.queue) >= settings.DISCORD_QUEUE_LIMIT:
                     return await ctx.respond("The queue is full!", ephemeral=True)
+            self.client.nowplaying.bind(ctx.guild.id, ctx.channel)
+            if search.startswith('history:'):
+                return await self.queue_history(ctx, player, search, started)
             search = f'ytsearch:{search}' if not RURL.match(search) else search
-            results = await player.node.get_tracks(search)
+            with_search = time.perf_counter()
+            results = await self.cache.get_tracks(player.node, search)
+            metrics.MUSIC_STAGE_LATENCY.observe(time.perf_counter() - with_search, stage='search')
             tracks = results.tracks
-            total = len(player.queue)
             match results.load_type:
                 case lavalink.LoadType.PLAYLIST:
-                    await ctx.defer()
-                    count = 0
-                    for track in tracks:
-                        if total + count < 250:
-                            player.add(track=track, requester=ctx.author.id)
-                            count += 1
+                    if not ctx.response.is_done():
+                        await ctx.defer()
+                    count = await player.actor.add(tracks, requester=ctx.author.id,
+                                                   requester_name=ctx.author.display_name, started=started)
                     await ctx.respond(embed=confirmation(f"Added {count} songs to the player"))
-                    if not player.is_playing:
-                        await player.play()
                 case lavalink.LoadType.TRACK:
                     song = tracks[0]
                     await ctx.respond(embed=confirmation(f"Adding {song.title} to the player"))
-                    player.add(track=song, requester=ctx.author.id)
-                    if not player.is_playing:
-                        await player.play()
+                    await player.actor.add([song], requester=ctx.author.id, requester_name=ctx.author.display_name,
+                                           started=started)
                 case lavalink.LoadType.SEARCH:
                     view = discord.ui.View(timeout=30)
                     view.add_item(SongSelect(self.client, tracks[:5], ctx.author))
@@ -375,23 +911,29 @@ class Music(commands.Cog):
                     test_for_response = await view.wait()
                     if test_for_response:  # returns True if a song wasn't picked
                         embed = discord.Embed(title="No song selected! Cancelling...", color=discord.Color.red())
-                        await message.edit_original_message(embed=embed, view=None)
+                        # A command held back during startup responds with a followup message
+                        edit = getattr(message, 'edit_original_message', None) or message.edit
+                        await edit(embed=embed, view=None)
                 case _:
-                    if 'open.spotify.com' or 'spotify:' in search:
-                        await ctx.defer()
-                        spotifysongs = self.get_spotify_tracks(query=search)
-                        if not spotifysongs:
-                            return await ctx.respond("Couldn't find any music!", ephemeral=True)
-                        s_results = await asyncio.wait_for(asyncio.gather(*[player.node.get_tracks(
-                            f'ytsearch:{song}') for song in spotifysongs]), timeout=30)
-                        count = 0
-                        for track in s_results:
-                            if total + count < 250:
-                                player.add(track=track.tracks[0], requester=ctx.author.id)
-                                count += 1
-                        await ctx.respond(embed=confirmation(f"Added {count} spotify song(s) to the player"))
-                        if not player.is_playing:
-                            await player.play()
+                    if sp.parse(search):
+                        with_spotify = time.perf_counter()
+                        await ctx.respond(embed=confirmation("Importing spotify song(s)..."))
+                        if settings.DISCORD_LAZY_IMPORTS:
+                            count, failed = await self.queue_spotify_songs(ctx, player, search, started)
+                        else:
+                            count, failed = await self.import_spotify_tracks(ctx, player, search, started)
+                        metrics.MUSIC_STAGE_LATENCY.observe(time.perf_counter() - with_spotify, stage='spotify_resolve')
+                        if not count:
+                            embed = discord.Embed(title="Couldn't find any music!", color=discord.Color.red())
+                            return await ctx.edit(embed=embed)
+                        embed = confirmation(f"Added {count} spotify song(s) to the player")
+                        if failed:
+                            failedlist = [f"`{result.query}` ({result.error})" for result in failed[:10]]
+                            if len(failed) > 10:
+                                failedlist.append(f"...and {len(failed) - 10} more")
+                            embed.add_field(name=f"__{len(failed)} song(s) could not be found__",
+                                            value="\n".join(failedlist)[:1024], inline=False)
+                        await ctx.edit(embed=embed)
                     else:
                         return await ctx.respond("Couldn't find any music!", ephemeral=True)
         else:
@@ -404,6 +946,136 @@ class Music(commands.Cog):
             embed = create_embed(guild=ctx.guild, track=player.current, position=player.position)
             await ctx.respond(embed=embed, view=bview, ephemeral=True)
 
+    playlist = SlashCommandGroup("playlist", "Save the queue as a playlist of this server and play it again later")
+
+    @staticmethod
+    def owns_playlist(user, playlist):
+        return playlist.owner == user.id or user.guild_permissions.kick_members
+
+    @staticmethod
+    def playlist_name(name):
+        name = PlaylistStore.normalize(name)
+        return name if name else None
+
+    @playlist.command(description="Save the current song and the queue as a playlist")
+    @slashcommandlogger
+    async def save(self, ctx, name: Option(str, description="Playlist name", max_length=100)):
+        player = self.client.lavalink.player_manager.get(ctx.guild.id) if self.client.lavalink else None
+        if player is None or (player.current is None and not player.queue):
+            return await ctx.respond("There is nothing to save!", ephemeral=True)
+        name = self.playlist_name(name)
+        if name is None:
+            return await ctx.respond("Please give the playlist a name", ephemeral=True)
+        existing = await self.playlists.get(ctx.guild.id, name)
+        if existing is not None and not self.owns_playlist(ctx.author, existing):
+            return await ctx.respond(f"The playlist {name} belongs to someone else!", ephemeral=True)
+        try:
+            await self.playlists.check(ctx.guild.id, name)
+        except PlaylistError as e:
+            return await ctx.respond(str(e), ephemeral=True)
+        await ctx.defer()
+        tracks = ([player.current] if player.current is not None else []) + list(player.queue)
+        tracks = tracks[:settings.DISCORD_QUEUE_LIMIT]
+        # Spotify songs that were not searched for yet have nothing to store, look them up once now
+        lazy = [track for track in tracks if isinstance(track, LazyTrack) and not track.resolved]
+        await asyncio.gather(*(track.resolve(player.node) for track in lazy), return_exceptions=True)
+        encoded = [track.track for track in tracks if track.track]
+        try:
+            await self.playlists.save(ctx.guild.id, name, ctx.author.id, encoded)
+        except PlaylistError as e:
+            # Another playlist was saved in the meantime, answer privately instead of in the public deferral
+            await ctx.delete()
+            return await ctx.respond(str(e), ephemeral=True)
+        embed = confirmation(f"Saved {len(encoded)} songs as {name}")
+        if len(encoded) < len(tracks):
+            embed.description = f"{len(tracks) - len(encoded)} song(s) could not be found and were left out"
+        await ctx.respond(embed=embed)
+
+    @playlist.command(description="Add a saved playlist to the queue")
+    @commands.cooldown(1, 5, commands.BucketType.user)
+    @slashcommandlogger
+    async def load(self, ctx, name: Option(str, description="Playlist name", max_length=100)):
+        started = time.perf_counter()
+        player = await self.join(ctx)
+        if player is None:
+            return
+        saved = await self.playlists.get(ctx.guild.id, name)
+        if saved is None:
+            return await ctx.respond(f"There is no playlist called {name}!", ephemeral=True)
+        self.client.nowplaying.bind(ctx.guild.id, ctx.channel)
+        # Stored tracks are decoded locally, loading a playlist never searches for a song
+        tracks = [lavalink.decode_track(encoded) for encoded in saved.tracks]
+        count = await player.actor.add(tracks, requester=ctx.author.id, requester_name=ctx.author.display_name,
+                                       started=started)
+        metrics.MUSIC_STAGE_LATENCY.observe(time.perf_counter() - started, stage='playlist_load')
+        if not count and tracks:
+            return await ctx.respond("The queue is full!", ephemeral=True)
+        await ctx.respond(embed=confirmation(f"Added {count} songs from {saved.name} to the player"))
+
+    @playlist.command(name='list', description="Show the saved playlists of this server")
+    @slashcommandlogger
+    async def list_playlists(self, ctx):
+        playlists = await self.playlists.list(ctx.guild.id)
+        if not playlists:
+            return await ctx.respond("This server has no saved playlists yet", ephemeral=True)
+        lines = []
+        for name, owner, size in playlists[:25]:
+            member = ctx.guild.get_member(owner)
+            lines.append(f"**{name}** - {size} songs" + (f" by {member.display_name}" if member else ""))
+        if len(playlists) > 25:
+            lines.append(f"...and {len(playlists) - 25} more")
+        embed = discord.Embed(title="__Saved playlists__", description="\n".join(lines)[:4096],
+                              color=discord.Color.light_gray())
+        await ctx.respond(embed=embed, ephemeral=True)
+
+    @playlist.command(description="Delete a saved playlist")
+    @slashcommandlogger
+    async def delete(self, ctx, name: Option(str, description="Playlist name", max_length=100)):
+        saved = await self.playlists.get(ctx.guild.id, name)
+        if saved is None:
+            return await ctx.respond(f"There is no playlist called {name}!", ephemeral=True)
+        if not self.owns_playlist(ctx.author, saved):
+            return await ctx.respond(f"The playlist {saved.name} belongs to someone else!", ephemeral=True)
+        await self.playlists.delete(ctx.guild.id, saved.name)
+        await ctx.respond(embed=confirmation(f"Deleted {saved.name}"), ephemeral=True)
+
+    @playlist.command(description="Download a saved playlist as a file")
+    @slashcommandlogger
+    async def export(self, ctx, name: Option(str, description="Playlist name", max_length=100)):
+        saved = await self.playlists.get(ctx.guild.id, name)
+        if saved is None:
+            return await ctx.respond(f"There is no playlist called {name}!", ephemeral=True)
+        file = discord.File(io.BytesIO(PlaylistStore.export(saved)), filename=f"{saved.name}.json")
+        await ctx.respond(f"{saved.name} with {len(saved.tracks)} songs", file=file, ephemeral=True)
+
+    @playlist.command(name='import', description="Save a playlist file exported with /playlist export")
+    @slashcommandlogger
+    async def import_playlist(self, ctx, file: Option(discord.Attachment, description="Exported playlist"),
+                              name: Option(str, description="Save it under another name", required=False,
+                                           default=None, max_length=100)):
+        if file.size > PLAYLIST_FILE_SIZE:
+            return await ctx.respond("That file is too big to be a playlist", ephemeral=True)
+        try:
+            saved_name, tracks = PlaylistStore.parse(await file.read())
+            name = self.playlist_name(name or saved_name)
+            if name is None:
+                raise PlaylistError("Please give the playlist a name")
+            tracks = tracks[:settings.DISCORD_QUEUE_LIMIT]
+            for encoded in tracks:
+                lavalink.decode_track(encoded)
+        except PlaylistError as e:
+            return await ctx.respond(str(e), ephemeral=True)
+        except Exception:
+            return await ctx.respond("That file contains songs that cannot be played", ephemeral=True)
+        existing = await self.playlists.get(ctx.guild.id, name)
+        if existing is not None and not self.owns_playlist(ctx.author, existing):
+            return await ctx.respond(f"The playlist {name} belongs to someone else!", ephemeral=True)
+        try:
+            await self.playlists.save(ctx.guild.id, name, ctx.author.id, tracks)
+        except PlaylistError as e:
+            return await ctx.respond(str(e), ephemeral=True)
+        await ctx.respond(embed=confirmation(f"Imported {len(tracks)} songs as {name}"))
+
 
 def setup(client):
     client.add_cog(Music(client))
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import discord
+
+import settings
+
+_log = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 2000
+
+
+class CommandLogSink:
+    """
+    Background sink for the command audit log.
+    Commands only put a line on a bounded queue; a worker task packs queued lines into as few
+    channel messages as possible and optionally appends structured records to a local file.
+    """
+
+    def __init__(self, max_queue=None, interval=None, path=None):
+        self.interval = interval or settings.DISCORD_LOG_FLUSH_INTERVAL
+        self.path = path if path is not None else settings.DISCORD_LOG_FILE
+        self.queue = asyncio.Queue(maxsize=max_queue or settings.DISCORD_LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self.sent = 0
+        self._reported_drops = 0
+        self._task = None
+
+    def submit(self, channel, line, record=None):
+        """
+        Queue a log line without waiting on Discord. Lines are dropped and counted when the queue is full.
+        :param channel: text channel to send the line to, may be None to only write the file
+        :param line: formatted log line
+        :param record: optional dict written to the structured log file
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._worker())
+        try:
+            self.queue.put_nowait((channel, line[:MESSAGE_LIMIT], record))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        # Let lines pile up instead of racing wait_for against the queue, which can swallow a cancellation
+        await asyncio.sleep(self.interval)
+        size = len(batch[0][1])
+        while size < MESSAGE_LIMIT and not self.queue.empty():
+            item = self.queue.get_nowait()
+            batch.append(item)
+            size += len(item[1]) + 1
+        return batch
+
+    @staticmethod
+    def pack(lines):
+        """
+        Join lines into messages that stay under the Discord message limit
+        :param lines: log lines
+        :return: list of message contents
+        """
+        messages = []
+        current = ""
+        for line in lines:
+            if current and len(current) + len(line) + 1 > MESSAGE_LIMIT:
+                messages.append(current)
+                current = ""
+            current = f"{current}\n{line}" if current else line
+        if current:
+            messages.append(current)
+        return messages
+
+    def _write(self, records):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record, default=str) + "\n")
+
+    async def flush(self, batch):
+        channels = {}
+        for channel, line, _ in batch:
+            if channel is not None:
+                channels.setdefault(channel, []).append(line)
+        if self.dropped > self._reported_drops and channels:
+            lines = next(iter(channels.values()))
+            lines.append(f":warning: {self.dropped - self._reported_drops} log line(s) dropped")
+            self._reported_drops = self.dropped
+        for channel, lines in channels.items():
+            for message in self.pack(lines):
+                await channel.send(message)
+                self.sent += 1
+        records = [record for _, _, record in batch if record is not None]
+        if self.path and records:
+            await asyncio.to_thread(self._write, records)
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self.flush(batch)
+            except Exception:
+                _log.exception("Failed to flush %d command log line(s)", len(batch))
+
+
+sink = CommandLogSink()
+
+
+def logCommand(channel, ctx, *args, **kwargs):
+    """
+    Queue a command for the audit log, the command never waits on the log channel
+    :param channel: log channel
+    :param ctx: command context
+    :param kwargs: command options
+    """
+    log_string = ":arrow_forward: Command:  "
+    log_string += ctx.channel.mention if isinstance(ctx.channel, discord.TextChannel) else "????"
+    log_string += f" | {ctx.author}: /{ctx.command} "
+
+    for k, v in kwargs.items():
+        log_string += f" {k}: {v}"
+    record = {
+        'time': time.time(),
+        'guild': ctx.guild.id if ctx.guild else None,
+        'channel': ctx.channel.id if ctx.channel else None,
+        'user': ctx.author.id,
+        'command': str(ctx.command),
+        'options': kwargs,
+    }
+    sink.submit(channel, log_string, record)
@@ -0,0 +1,56 @@
+class ListenerIndex:
+    """
+    Listeners in the bot's voice channel per guild, kept up to date from voice state deltas
+    so a voice event costs a set update instead of a scan of the channel.
+    Listeners are tracked by id because members may not be cached without the members intent.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.channels = {}
+        self.listeners = {}
+
+    def reset(self, guild_id, channel):
+        """
+        Start tracking the channel the bot is in, counting the members already in it
+        :param guild_id: guild id
+        :param channel: voice channel the bot is connected to
+        :return: number of listeners
+        """
+        listeners = set()
+        for user_id in channel.voice_states:
+            member = channel.guild.get_member(user_id)
+            if user_id != self.client.user.id and not (member is not None and member.bot):
+                listeners.add(user_id)
+        self.channels[guild_id] = channel.id
+        self.listeners[guild_id] = listeners
+        return len(listeners)
+
+    def forget(self, guild_id):
+        self.channels.pop(guild_id, None)
+        self.listeners.pop(guild_id, None)
+
+    def count(self, guild_id):
+        return len(self.listeners.get(guild_id, ()))
+
+    def update(self, member, before, after):
+        """
+        Apply a member's voice state change
+        :param member: member whose voice state changed
+        :param before: voice state before the change
+        :param after: voice state after the change
+        :return: new number of listeners, None when the bot's channel was not affected
+        """
+        channel_id = self.channels.get(member.guild.id)
+        if channel_id is None:
+            return None
+        was_listening = before.channel is not None and before.channel.id == channel_id
+        is_listening = after.channel is not None and after.channel.id == channel_id
+        if was_listening == is_listening:
+            return None
+        listeners = self.listeners[member.guild.id]
+        if is_listening and not member.bot:
+            listeners.add(member.id)
+        else:
+            listeners.discard(member.id)
+        return len(listeners)
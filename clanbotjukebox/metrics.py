@@ -0,0 +1,228 @@
+import asyncio
+import bisect
+import functools
+import resource
+import time
+
+from aiohttp import web
+
+import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(names, values)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield "", self.labels, key, value
+
+
+class Gauge(Metric):
+    """
+    Gauge that is either set directly or read from a function at scrape time.
+    The function returns an iterable of (label values, value) pairs.
+    """
+    kind = 'gauge'
+
+    def __init__(self, *args, function=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {}
+        self.function = function
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def samples(self):
+        values = self.values.items() if self.function is None else self.function()
+        for key, value in values:
+            yield "", self.labels, key, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        counts[0][bisect.bisect_left(self.buckets, value)] += 1
+        counts[1] += value
+        counts[2] += 1
+
+    def samples(self):
+        names = self.labels + ('le',)
+        for key, (buckets, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), buckets):
+                cumulative += bucket
+                yield "_bucket", names, key + (bound,), cumulative
+            yield "_sum", self.labels, key, total
+            yield "_count", self.labels, key, count
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        # Re-registering a name (e.g. when the cog is reloaded) replaces the old metric
+        self.metrics = [existing for existing in self.metrics if existing.name != metric.name]
+        self.metrics.append(metric)
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+COMMAND_LATENCY = Histogram('jukebox_command_seconds', "Slash command latency", ['command'])
+MUSIC_STAGE_LATENCY = Histogram('jukebox_music_stage_seconds', "Latency of the stages of /music", ['stage'])
+BUTTON_LATENCY = Histogram('jukebox_button_seconds', "Player button interaction latency", ['button'])
+GET_TRACKS = Counter('jukebox_get_tracks_total', "Lavalink get_tracks calls", ['load_type'])
+GET_TRACKS_FAILURES = Counter('jukebox_get_tracks_failures_total', "Failed Lavalink get_tracks calls", ['error'])
+GET_TRACKS_LATENCY = Histogram('jukebox_get_tracks_seconds', "Lavalink get_tracks latency")
+NOW_PLAYING = Counter('jukebox_now_playing_total', "Now playing changes and the message edits they were coalesced into",
+                      ['kind'])
+LAZY_TRACKS = Counter('jukebox_lazy_tracks_total', "Lazy queue entries queued, resolved and failed", ['result'])
+LAVALINK_EVENTS = Counter('jukebox_lavalink_events_total', "Lavalink events received", ['event'])
+GATEWAY_EVENTS = Counter('jukebox_gateway_events_total', "Gateway events received", ['event'])
+SHARD_EVENTS = Counter('jukebox_shard_events_total', "Shard ready, disconnect and resume events", ['shard', 'event'])
+PLAYER_ACTOR = Counter('jukebox_player_actor_messages_total', "Player operations sent to the guild mailboxes", ['kind'])
+PLAYER_ACTOR_BATCHES = Counter('jukebox_player_actor_batches_total', "Bulk appends the queued adds were merged into")
+SINGLE_FLIGHT = Counter('jukebox_single_flight_total', "Track lookups that started a request or shared one in flight, "
+                        "every shared lookup is a Lavalink request saved", ['result'])
+SINGLE_FLIGHT_WAITERS = Histogram('jukebox_single_flight_waiters', "Lookups that shared a request besides its starter",
+                                  buckets=(0, 1, 2, 5, 10, 25, 50, 100))
+SPOTIFY_MATCHES = Counter('jukebox_spotify_matches_total', "How Spotify songs were matched to Lavalink tracks",
+                          ['method'])
+STARTUP_PHASE = Gauge('jukebox_startup_phase_seconds', "Seconds after process start a startup phase finished",
+                      ['phase'])
+EVENT_LOOP_LAG = Histogram('jukebox_event_loop_lag_seconds', "Delay of the event loop waking up a sleeping task",
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+
+def resident_memory():
+    """
+    Resident set size of this process in bytes, read from /proc where available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is the peak in kilobytes, the closest portable approximation
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+Gauge('jukebox_resident_memory_bytes', "Resident memory of the bot process", function=lambda: [((), resident_memory())])
+
+
+def timed(histogram, **labels):
+    """
+    Decorator observing how long a coroutine function takes
+    :param histogram: histogram to observe into
+    :param labels: labels for the observation
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapped
+    return decorator
+
+
+async def get_tracks(node, query):
+    """
+    node.get_tracks with call, failure and latency accounting
+    :param node: Lavalink node
+    :param query: Lavalink identifier
+    :return: LoadResult
+    """
+    start = time.perf_counter()
+    try:
+        results = await node.get_tracks(query)
+    except Exception as e:
+        GET_TRACKS_FAILURES.inc(error=type(e).__name__)
+        raise
+    finally:
+        GET_TRACKS_LATENCY.observe(time.perf_counter() - start)
+    GET_TRACKS.inc(load_type=results.load_type.name)
+    return results
+
+
+async def monitor_event_loop(interval=0.5, histogram=EVENT_LOOP_LAG):
+    """
+    Observe how late the event loop wakes up a task sleeping for interval, until cancelled
+    :param interval: seconds between samples
+    :param histogram: anything with an observe method, the event loop lag histogram by default
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        histogram.observe(max(loop.time() - start - interval, 0))
+
+
+async def serve(host=None, port=None):
+    """
+    Expose the registry on /metrics in the Prometheus text format
+    """
+    async def handler(request):
+        return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host or settings.DISCORD_METRICS_HOST, port or settings.DISCORD_METRICS_PORT)
+    await site.start()
+    return runner
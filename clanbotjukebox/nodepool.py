@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+
+import settings
+
+_log = logging.getLogger(__name__)
+
+
+class NodePool:
+    """
+    Places players on the least loaded Lavalink node and moves them off nodes that go down or stop reporting stats.
+    """
+
+    def __init__(self, lavaclient, nodes=None, stats_timeout=None):
+        self.lavalink = lavaclient
+        self.stats_timeout = stats_timeout or settings.DISCORD_LAVALINK_STATS_TIMEOUT
+        self._stats_seen = {}
+        for node in nodes if nodes is not None else settings.DISCORD_LAVALINK_NODES:
+            self.lavalink.add_node(host=node['host'], port=node['port'], password=node['password'],
+                                   region=node['region'], name=node.get('name'))
+
+    @property
+    def nodes(self):
+        return list(self.lavalink.node_manager)
+
+    def is_healthy(self, node):
+        """
+        A node is healthy when its websocket is up and it is still sending stats.
+        Stats are replaced on every update, so an unchanged object means the node has gone quiet (e.g. a GC pause).
+        :param node: Lavalink node
+        :return: True when new players can be placed on the node
+        """
+        if not node.available:
+            return False
+        seen = self._stats_seen.get(node)
+        now = time.monotonic()
+        if seen is None or seen[0] is not node.stats:
+            self._stats_seen[node] = (node.stats, now)
+            return True
+        return node.stats.is_fake or now - seen[1] < self.stats_timeout
+
+    @staticmethod
+    def score(node):
+        """
+        Load score of a node, lower is better.
+        Uses the CPU used by the Lavalink process itself, playing players and frame deficit reported in the stats,
+        and counts players placed locally since the last stats update so a burst of joins is spread out.
+        :param node: Lavalink node
+        :return: score
+        """
+        stats = node.stats
+        players = max(stats.playing_players, len(node.players))
+        cpu = 1.05 ** (100 * stats.lavalink_load) * 10 - 10
+        deficit = 0
+        if stats.frames_deficit > 0:
+            deficit = 1.03 ** (500 * (stats.frames_deficit / 3000)) * 600 - 600
+        nulled = 0
+        if stats.frames_nulled > 0:
+            nulled = (1.03 ** (500 * (stats.frames_nulled / 3000)) * 300 - 300) * 2
+        return players + cpu + deficit + nulled
+
+    def best_node(self, exclude=None):
+        """
+        Pick the healthy node with the lowest score
+        :param exclude: node to leave out, e.g. the one that is failing
+        :return: Lavalink node or None when no node is healthy
+        """
+        candidates = [node for node in self.nodes if node is not exclude and self.is_healthy(node)]
+        if not candidates:
+            return None
+        return min(candidates, key=self.score)
+
+    def create_player(self, guild_id):
+        """
+        Get the guild's player, creating it on the least loaded node if it does not exist yet
+        :param guild_id: guild id
+        :return: Lavalink player
+        """
+        player = self.lavalink.player_manager.get(guild_id)
+        if player:
+            return player
+        return self.lavalink.player_manager.create(guild_id, node=self.best_node())
+
+    async def failover(self, node):
+        """
+        Move every player off a node. change_node restarts the current track at its last known position.
+        When a node disconnects, lavalink's NodeManager calls node_unavailable on its players, awaits the
+        NodeDisconnectedEvent hooks and only then moves whatever is still on the node to the single node with the
+        lowest penalty. Running this from that hook spreads the players by score and skips nodes that stopped
+        reporting stats; the library's move is left as the fallback for players this could not place.
+        :param node: node that went down or stopped reporting stats
+        """
+        for player in node.players:
+            target = self.best_node(exclude=node)
+            if target is None:
+                _log.error("No healthy Lavalink node to move guild %s to", player.guild_id)
+                return
+            await player.change_node(target)
+            _log.info("Moved guild %s from node %s to %s", player.guild_id, node.name, target.name)
+
+    async def monitor(self):
+        """
+        Periodically move players off nodes whose websocket is up but that stopped reporting stats
+        """
+        while True:
+            await asyncio.sleep(self.stats_timeout / 2)
+            for node in self.nodes:
+                if node.available and node.players and not self.is_healthy(node):
+                    _log.warning("Lavalink node %s stopped reporting stats, moving its players", node.name)
+                    await self.failover(node)
@@ -0,0 +1,155 @@
+import asyncio
+import collections
+import logging
+import time
+
+import discord
+
+import metrics
+import settings
+
+_log = logging.getLogger(__name__)
+
+
+class Panel:
+
+    def __init__(self, channel, history):
+        self.channel = channel
+        self.message = None
+        self.announcements = collections.deque(maxlen=history)
+        self.dirty = True
+        self.closing = False
+        self.updated = 0
+
+
+class NowPlaying:
+    """
+    One persistent now playing message per guild, owned by a single background task.
+    Player changes and announcements only mark the guild's message dirty; the task re-renders it at most
+    once per interval, so a burst of button presses costs one message edit instead of one per press.
+    While a song is playing the message is also refreshed periodically to keep the position current.
+    """
+
+    def __init__(self, client, render, interval=None, refresh=None, history=5):
+        """
+        :param client: bot the players belong to
+        :param render: callable(guild, player) returning the now playing embed
+        :param interval: minimum seconds between two edits of the same message
+        :param refresh: seconds between position updates while playing, 0 disables them
+        :param history: number of announcements shown on the message
+        """
+        self.client = client
+        self.render = render
+        self.interval = interval or settings.DISCORD_NOW_PLAYING_INTERVAL
+        self.refresh_interval = settings.DISCORD_NOW_PLAYING_REFRESH if refresh is None else refresh
+        self.history = history
+        self.panels = {}
+        self._task = None
+
+    def bind(self, guild_id, channel):
+        """
+        Set the text channel a guild's now playing message lives in
+        :param guild_id: guild id
+        :param channel: text channel
+        """
+        panel = self.panels.get(guild_id)
+        if panel is None or panel.closing:
+            self.panels[guild_id] = Panel(channel, self.history)
+        elif panel.channel != channel:
+            panel.channel = channel
+            panel.message = None
+            panel.dirty = True
+        self._start()
+
+    def refresh(self, guild_id):
+        panel = self.panels.get(guild_id)
+        if panel is not None:
+            panel.dirty = True
+            metrics.NOW_PLAYING.inc(kind='change')
+
+    def announce(self, guild_id, text):
+        """
+        Show a line on the next update of the guild's message instead of sending a message of its own
+        :param guild_id: guild id
+        :param text: announcement
+        """
+        panel = self.panels.get(guild_id)
+        if panel is not None:
+            panel.announcements.append(text)
+            panel.dirty = True
+            metrics.NOW_PLAYING.inc(kind='change')
+
+    def close(self, guild_id):
+        """
+        Render the message one last time and stop updating it
+        :param guild_id: guild id
+        """
+        panel = self.panels.get(guild_id)
+        if panel is not None:
+            panel.closing = True
+            panel.dirty = True
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _due(self, panel, player, now):
+        if now - panel.updated < self.interval:
+            return False
+        if panel.dirty:
+            return True
+        playing = player is not None and player.is_playing and not player.paused
+        return bool(self.refresh_interval) and playing and now - panel.updated >= self.refresh_interval
+
+    def _embed(self, panel, player):
+        if panel.closing or player is None or player.current is None:
+            embed = discord.Embed(title="Nothing playing", color=discord.Color.light_gray())
+        else:
+            embed = self.render(panel.channel.guild, player)
+        if panel.announcements:
+            embed.add_field(name="__Recent__", value="\n".join(panel.announcements)[:1024], inline=False)
+        return embed
+
+    async def update(self, guild_id, panel):
+        player = self.client.lavalink.player_manager.get(guild_id) if self.client.lavalink else None
+        if panel.closing and panel.message is None:
+            del self.panels[guild_id]
+            return
+        panel.dirty = False
+        panel.updated = time.monotonic()
+        embed = self._embed(panel, player)
+        try:
+            if panel.message is None:
+                panel.message = await panel.channel.send(embed=embed)
+            else:
+                await panel.message.edit(embed=embed)
+            metrics.NOW_PLAYING.inc(kind='edit')
+        except discord.NotFound:
+            # Someone deleted the message, post a new one on the next update
+            panel.message = None
+            panel.dirty = True
+        if panel.closing and self.panels.get(guild_id) is panel:
+            del self.panels[guild_id]
+
+    async def _update(self, guild_id, panel):
+        try:
+            await self.update(guild_id, panel)
+        except Exception:
+            _log.exception("Failed to update the now playing message of guild %s", guild_id)
+
+    async def run(self):
+        tick = min(self.interval, self.refresh_interval or self.interval, 1)
+        while True:
+            now = time.monotonic()
+            due = []
+            for guild_id, panel in list(self.panels.items()):
+                player = self.client.lavalink.player_manager.get(guild_id) if self.client.lavalink else None
+                if self._due(panel, player, now):
+                    due.append(self._update(guild_id, panel))
+            # Edits of different guilds go to different channels, so they do not share a rate limit
+            await asyncio.gather(*due)
+            await asyncio.sleep(tick)
@@ -0,0 +1,98 @@
+import asyncio
+import collections
+import time
+
+import metrics
+import settings
+
+Message = collections.namedtuple('Message', ['kind', 'args', 'future'])
+
+
+class PlayerActor:
+    """
+    Mailbox that runs a guild's player operations one at a time, in the order they were sent.
+    Adds that are waiting back to back are merged into one bulk append, checked against the queue limit
+    when it is applied, so concurrent imports cannot overshoot the limit and only one of them starts playback.
+    The worker task only runs while there are messages, idle guilds cost nothing.
+    """
+
+    def __init__(self, player, limit=None):
+        """
+        :param player: JukeboxPlayer the operations are applied to
+        :param limit: maximum number of songs in the queue
+        """
+        self.player = player
+        self.limit = limit or settings.DISCORD_QUEUE_LIMIT
+        self.mailbox = collections.deque()
+        self._task = None
+
+    def _send(self, kind, *args):
+        future = asyncio.get_running_loop().create_future()
+        self.mailbox.append(Message(kind, args, future))
+        metrics.PLAYER_ACTOR.inc(kind=kind)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return future
+
+    def add(self, tracks, requester=0, requester_name=None, started=None):
+        """
+        Append tracks to the queue and start playback if the player is idle
+        :param tracks: AudioTracks or track dicts
+        :param requester: user id of the requester
+        :param requester_name: display name of the requester
+        :param started: perf_counter when the command started, to time the first play
+        :return: awaitable number of tracks that fit in the queue
+        """
+        return self._send('add', list(tracks), requester, requester_name, started)
+
+    def call(self, func, *args):
+        """
+        Run an operation on the player in turn with the others, e.g. a skip or a cleanup
+        :param func: coroutine function called with the player and args
+        :return: awaitable result of func
+        """
+        return self._send('call', func, *args)
+
+    async def _run(self):
+        while self.mailbox:
+            message = self.mailbox.popleft()
+            if message.kind == 'add':
+                batch = [message]
+                while self.mailbox and self.mailbox[0].kind == 'add':
+                    batch.append(self.mailbox.popleft())
+                await self._apply_adds(batch)
+                continue
+            func, *args = message.args
+            try:
+                result = await func(self.player, *args)
+            except Exception as e:
+                if not message.future.done():
+                    message.future.set_exception(e)
+            else:
+                if not message.future.done():
+                    message.future.set_result(result)
+
+    async def _apply_adds(self, batch):
+        metrics.PLAYER_ACTOR_BATCHES.inc()
+        room = self.limit - len(self.player.queue)
+        counts = []
+        try:
+            for message in batch:
+                tracks, requester, requester_name, _ = message.args
+                accepted = tracks[:max(room, 0)]
+                room -= len(accepted)
+                self.player.add_many(accepted, requester=requester, requester_name=requester_name)
+                counts.append(len(accepted))
+            if any(counts) and not self.player.is_playing:
+                await self.player.play()
+                times = [message.args[3] for message in batch if message.args[3] is not None]
+                if times:
+                    metrics.MUSIC_STAGE_LATENCY.observe(time.perf_counter() - min(times), stage='first_play')
+        except Exception as e:
+            for message in batch:
+                if not message.future.done():
+                    message.future.set_exception(e)
+            return
+        for message, count in zip(batch, counts):
+            if not message.future.done():
+                message.future.set_result(count)
@@ -0,0 +1,184 @@
+import asyncio
+import collections
+import concurrent.futures
+import heapq
+import os
+import re
+import sqlite3
+import time
+
+import settings
+
+RWORDS = re.compile(r'[^\w]+')
+
+
+def _words(text):
+    return RWORDS.sub(' ', text.lower()).split()
+
+
+def _grams(word):
+    """
+    Keys a word is indexed under: its one and two character prefixes for short queries and every trigram,
+    with the leading space marking the start of the word
+    """
+    word = f' {word}'
+    return {word[:2], word[:3]} | {word[index:index + 3] for index in range(len(word) - 2)}
+
+
+class Entry:
+    __slots__ = ('id', 'identifier', 'track', 'title', 'author', 'plays', 'played', 'text')
+
+    def __init__(self, entry_id, identifier, track, title, author, plays, played):
+        self.id = entry_id
+        self.identifier = identifier
+        self.track = track
+        self.title = title
+        self.author = author
+        self.plays = plays
+        self.played = played
+        self.text = f" {' '.join(_words(f'{title} {author}'))}"
+
+    @property
+    def label(self):
+        return f"{self.title} - {self.author}"[:100]
+
+
+class GuildHistory:
+    """
+    Songs a guild played, indexed by word prefix and trigram of their title and author
+    """
+
+    def __init__(self):
+        self.entries = {}
+        # Least recently played first
+        self.identifiers = collections.OrderedDict()
+        self.grams = collections.defaultdict(set)
+
+    def add(self, entry):
+        self.entries[entry.id] = entry
+        self.identifiers[entry.identifier] = entry
+        for word in entry.text.split():
+            for gram in _grams(word):
+                self.grams[gram].add(entry.id)
+
+    def remove(self, entry):
+        del self.entries[entry.id]
+        del self.identifiers[entry.identifier]
+        for word in entry.text.split():
+            for gram in _grams(word):
+                ids = self.grams[gram]
+                ids.discard(entry.id)
+                if not ids:
+                    del self.grams[gram]
+
+    def search(self, query, limit):
+        words = _words(query)
+        if not words:
+            candidates = self.entries.keys()
+        else:
+            candidates = None
+            for word in words:
+                keys = _grams(word) if len(word) > 2 else {f' {word}'}
+                for key in keys:
+                    ids = self.grams.get(key, set())
+                    candidates = ids if candidates is None else candidates & ids
+                    if not candidates:
+                        return []
+        # Trigrams can match out of order, check that every word really starts a word of the song
+        matches = (self.entries[entry_id] for entry_id in candidates)
+        matches = (entry for entry in matches if all(f' {word}' in entry.text for word in words))
+        return heapq.nlargest(limit, matches, key=lambda entry: (entry.plays, entry.played))
+
+
+class PlayHistory:
+    """
+    Songs every guild played, kept in memory for autocomplete and optionally in a SQLite file across restarts.
+    Songs are stored as encoded Lavalink tracks so a suggestion can be queued without searching for it again.
+    Entry ids only live in memory, they are handed out as autocomplete values and resolved back by the same process.
+    """
+
+    def __init__(self, path=None, size=None):
+        self.path = path if path is not None else settings.DISCORD_HISTORY_PATH
+        self.size = size or settings.DISCORD_HISTORY_SIZE
+        self.guilds = collections.defaultdict(GuildHistory)
+        self._next_id = 1
+        self._db = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        if self.path:
+            self._open()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS history (guild_id INTEGER NOT NULL, identifier TEXT NOT NULL, "
+                         "track TEXT NOT NULL, title TEXT NOT NULL, author TEXT NOT NULL, "
+                         "plays INTEGER NOT NULL DEFAULT 1, played REAL NOT NULL, PRIMARY KEY (guild_id, identifier))")
+        self._db.commit()
+        for guild_id, *row in self._db.execute("SELECT guild_id, identifier, track, title, author, plays, played "
+                                               "FROM history ORDER BY played"):
+            self._add(guild_id, *row)
+
+    def _add(self, guild_id, identifier, track, title, author, plays, played):
+        history = self.guilds[guild_id]
+        entry = Entry(self._next_id, identifier, track, title, author, plays, played)
+        self._next_id += 1
+        history.add(entry)
+        return entry
+
+    def _disk_record(self, guild_id, entry, evicted):
+        self._db.execute("INSERT OR REPLACE INTO history (guild_id, identifier, track, title, author, plays, played) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", (guild_id, entry.identifier, entry.track, entry.title,
+                                                          entry.author, entry.plays, entry.played))
+        self._db.executemany("DELETE FROM history WHERE guild_id = ? AND identifier = ?",
+                             [(guild_id, identifier) for identifier in evicted])
+        self._db.commit()
+
+    async def record(self, guild_id, track):
+        """
+        Remember a song a guild played
+        :param guild_id: guild id
+        :param track: AudioTrack that started playing
+        """
+        if not track.track:
+            return
+        history = self.guilds[guild_id]
+        now = time.time()
+        entry = history.identifiers.get(track.identifier)
+        if entry is not None:
+            entry.plays += 1
+            entry.played = now
+            entry.track = track.track
+            history.identifiers.move_to_end(entry.identifier)
+        else:
+            entry = self._add(guild_id, track.identifier, track.track, track.title, track.author, 1, now)
+        evicted = []
+        while len(history.entries) > self.size:
+            stale = next(iter(history.identifiers.values()))
+            history.remove(stale)
+            evicted.append(stale.identifier)
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._disk_record, guild_id, entry,
+                                                             evicted)
+
+    def suggest(self, guild_id, query, limit=25):
+        """
+        Songs of the guild's history matching what was typed so far, most played first
+        :param guild_id: guild id
+        :param query: partial search
+        :param limit: maximum number of suggestions, Discord shows up to 25
+        :return: list of entries
+        """
+        history = self.guilds.get(guild_id)
+        return history.search(query, limit) if history is not None else []
+
+    def get(self, guild_id, entry_id):
+        history = self.guilds.get(guild_id)
+        return history.entries.get(entry_id) if history is not None else None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._db is not None:
+            self._db.close()
+            self._db = None
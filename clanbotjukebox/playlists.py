@@ -0,0 +1,133 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sqlite3
+import time
+
+import settings
+
+Playlist = collections.namedtuple('Playlist', ['name', 'owner', 'tracks', 'created'])
+
+
+class PlaylistError(Exception):
+    pass
+
+
+class PlaylistStore:
+    """
+    Named playlists per guild, stored as encoded Lavalink tracks so loading one never searches for a song.
+    A playlist is a single row holding its tracks as one newline separated string.
+    """
+
+    def __init__(self, path=None, limit=None):
+        self.path = path or settings.DISCORD_PLAYLIST_PATH or ':memory:'
+        self.limit = limit or settings.DISCORD_PLAYLIST_LIMIT
+        # sqlite is blocking, keep all disk access on one worker thread
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS playlists (guild_id INTEGER NOT NULL, name TEXT NOT NULL, "
+                         "owner INTEGER NOT NULL, tracks TEXT NOT NULL, size INTEGER NOT NULL, "
+                         "created REAL NOT NULL, PRIMARY KEY (guild_id, name))")
+        self._db.commit()
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(name.split())[:100]
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _get(self, guild_id, name):
+        row = self._db.execute("SELECT name, owner, tracks, created FROM playlists WHERE guild_id = ? AND name = ?",
+                               (guild_id, name)).fetchone()
+        if row is None:
+            return None
+        name, owner, tracks, created = row
+        return Playlist(name, owner, tracks.split('\n') if tracks else [], created)
+
+    def _check(self, guild_id, name):
+        exists = self._db.execute("SELECT 1 FROM playlists WHERE guild_id = ? AND name = ?",
+                                  (guild_id, name)).fetchone()
+        count = self._db.execute("SELECT COUNT(*) FROM playlists WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+        if not exists and count >= self.limit:
+            raise PlaylistError(f"This server already has {self.limit} playlists")
+
+    def _save(self, guild_id, name, owner, tracks):
+        self._check(guild_id, name)
+        self._db.execute("INSERT OR REPLACE INTO playlists (guild_id, name, owner, tracks, size, created) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (guild_id, name, owner, '\n'.join(tracks), len(tracks),
+                                                       time.time()))
+        self._db.commit()
+
+    def _delete(self, guild_id, name):
+        deleted = self._db.execute("DELETE FROM playlists WHERE guild_id = ? AND name = ?", (guild_id, name)).rowcount
+        self._db.commit()
+        return deleted > 0
+
+    def _list(self, guild_id):
+        return self._db.execute("SELECT name, owner, size FROM playlists WHERE guild_id = ? ORDER BY name",
+                                (guild_id,)).fetchall()
+
+    async def get(self, guild_id, name):
+        """
+        :return: Playlist or None when the guild has no playlist with that name
+        """
+        return await self._run(self._get, guild_id, self.normalize(name))
+
+    async def check(self, guild_id, name):
+        """
+        Raise PlaylistError when saving under this name would go over the guild's playlist limit
+        """
+        await self._run(self._check, guild_id, self.normalize(name))
+
+    async def save(self, guild_id, name, owner, tracks):
+        """
+        Create or replace a playlist
+        :param name: playlist name
+        :param owner: user id of the member saving it
+        :param tracks: encoded Lavalink tracks
+        """
+        await self._run(self._save, guild_id, self.normalize(name), owner, list(tracks))
+
+    async def delete(self, guild_id, name):
+        return await self._run(self._delete, guild_id, self.normalize(name))
+
+    async def list(self, guild_id):
+        """
+        :return: list of (name, owner, number of tracks) tuples
+        """
+        return await self._run(self._list, guild_id)
+
+    @staticmethod
+    def export(playlist):
+        """
+        Serialize a playlist for a file that can be imported in any guild
+        :return: JSON bytes
+        """
+        return json.dumps({'name': playlist.name, 'tracks': playlist.tracks}).encode()
+
+    @staticmethod
+    def parse(data):
+        """
+        Read an exported playlist file
+        :param data: file contents
+        :return: name and list of encoded tracks
+        """
+        try:
+            content = json.loads(data)
+            name, tracks = content['name'], content['tracks']
+        except (ValueError, KeyError, TypeError):
+            raise PlaylistError("That file is not an exported playlist")
+        if not isinstance(name, str) or not isinstance(tracks, list) \
+                or not all(isinstance(track, str) and track and '\n' not in track for track in tracks):
+            raise PlaylistError("That file is not an exported playlist")
+        return name, tracks
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._db.close()
@@ -0,0 +1,148 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import time
+
+import settings
+
+_log = logging.getLogger(__name__)
+
+
+class QueueStore:
+    """
+    SQLite snapshot of every guild's player so queues survive a restart.
+    Tracks are stored as encoded Lavalink strings with their requester, lazy entries that were not searched for
+    yet keep an empty track and their metadata as JSON. Changes are recorded as
+    small row level operations and written in one transaction per flush instead of rewriting whole queues.
+    """
+
+    def __init__(self, path=None, interval=None):
+        self.path = path or settings.DISCORD_QUEUE_STORE_PATH
+        self.interval = interval or settings.DISCORD_QUEUE_STORE_INTERVAL
+        self._ops = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS players (
+                guild_id INTEGER PRIMARY KEY,
+                channel_id INTEGER,
+                current TEXT,
+                current_requester INTEGER,
+                position INTEGER NOT NULL DEFAULT 0,
+                paused INTEGER NOT NULL DEFAULT 0,
+                shuffle INTEGER NOT NULL DEFAULT 0,
+                loop INTEGER NOT NULL DEFAULT 0,
+                volume INTEGER NOT NULL DEFAULT 100,
+                updated REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS queue (
+                id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                seq REAL NOT NULL,
+                track TEXT NOT NULL,
+                requester INTEGER NOT NULL,
+                meta TEXT
+            );
+            CREATE INDEX IF NOT EXISTS queue_guild ON queue (guild_id, seq);
+        """)
+        if 'meta' not in [column[1] for column in self._db.execute("PRAGMA table_info(queue)")]:
+            self._db.execute("ALTER TABLE queue ADD COLUMN meta TEXT")
+        # Shard worker processes share the file, each hands out ids from its own residue class
+        self._id_step = settings.DISCORD_SHARD_PROCESSES or 1
+        next_id = (self._db.execute("SELECT MAX(id) FROM queue").fetchone()[0] or 0) + 1
+        self._next_id = next_id + ((settings.DISCORD_SHARD_WORKER or 0) - next_id) % self._id_step
+
+    def next_id(self):
+        entry_id = self._next_id
+        self._next_id += self._id_step
+        return entry_id
+
+    def enqueue(self, guild_id, entry_id, seq, track, requester, meta=None):
+        self._ops.append(("INSERT OR REPLACE INTO queue (id, guild_id, seq, track, requester, meta) "
+                          "VALUES (?, ?, ?, ?, ?, ?)", (entry_id, guild_id, seq, track or '', requester, meta)))
+
+    def resolve(self, entry_id, track):
+        self._ops.append(("UPDATE queue SET track = ? WHERE id = ?", (track, entry_id)))
+
+    def remove(self, entry_ids):
+        self._ops.extend(("DELETE FROM queue WHERE id = ?", (entry_id,)) for entry_id in entry_ids)
+
+    def save_player(self, player):
+        """
+        Record the player's current track and settings
+        :param player: Lavalink player
+        """
+        current = player.current
+        self._ops.append((
+            "INSERT OR REPLACE INTO players (guild_id, channel_id, current, current_requester, position, paused, "
+            "shuffle, loop, volume, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (player.guild_id, player.channel_id, current.track if current else None,
+             current.requester if current else None, int(player.position), int(player.paused),
+             int(player.shuffle), player.loop, player.volume, time.time())))
+
+    def save_position(self, player):
+        self._ops.append(("UPDATE players SET position = ?, paused = ?, updated = ? WHERE guild_id = ?",
+                          (int(player.position), int(player.paused), time.time(), player.guild_id)))
+
+    def forget(self, guild_id):
+        self._ops.append(("DELETE FROM queue WHERE guild_id = ?", (guild_id,)))
+        self._ops.append(("DELETE FROM players WHERE guild_id = ?", (guild_id,)))
+
+    def _execute(self, ops):
+        with self._db:
+            for sql, params in ops:
+                self._db.execute(sql, params)
+
+    async def flush(self):
+        if not self._ops:
+            return
+        ops, self._ops = self._ops, []
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._execute, ops)
+
+    async def run(self, players):
+        """
+        Flush pending changes and the positions of playing players every interval
+        :param players: callable returning the players to save positions for
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            for player in players():
+                if player.is_playing:
+                    self.save_position(player)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                _log.exception("Failed to write the queue snapshot")
+
+    def _load(self):
+        snapshots = {}
+        for row in self._db.execute("SELECT guild_id, channel_id, current, current_requester, position, paused, "
+                                    "shuffle, loop, volume FROM players"):
+            snapshots[row[0]] = {
+                'channel_id': row[1], 'current': row[2], 'current_requester': row[3], 'position': row[4],
+                'paused': bool(row[5]), 'shuffle': bool(row[6]), 'loop': row[7], 'volume': row[8], 'queue': [],
+            }
+        for entry_id, guild_id, seq, track, requester, meta in self._db.execute(
+                "SELECT id, guild_id, seq, track, requester, meta FROM queue ORDER BY guild_id, seq"):
+            if guild_id in snapshots:
+                snapshots[guild_id]['queue'].append((entry_id, seq, track or None, requester, meta))
+        return snapshots
+
+    async def load(self):
+        """
+        Read every stored player snapshot
+        :return: dict of guild id to snapshot dict
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._ops:
+            self._execute(self._ops)
+            self._ops = []
+        self._db.close()
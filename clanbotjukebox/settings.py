@@ -10,13 +10,30 @@ load_dotenv()
 def _int(name: str):
     try:
         return int(name)
-    except ValueError:
+    except (TypeError, ValueError):
         return None
 
+
+def _ints(value: str):
+    """
+    Parse a comma separated list of integers and inclusive ranges, e.g. 0-3,8
+    """
+    numbers = []
+    for part in filter(None, (part.strip() for part in (value or '').split(','))):
+        first, _, last = part.partition('-')
+        numbers.extend(range(int(first), int(last or first) + 1))
+    return numbers
+
 # Get General Bot settings
 DISCORD_TOKEN = os.getenv('BOT_TOKEN')
 DISCORD_GUILD_ID = _int(os.getenv('GUILD_ID'))
 DISCORD_LOG_CHANNEL = _int(os.getenv('LOG_CHANNEL'))
+# Maximum number of command log lines waiting to be sent before new lines are dropped
+DISCORD_LOG_QUEUE_SIZE = _int(os.getenv('LOG_QUEUE_SIZE', '1000'))
+# Seconds to collect command log lines before they are sent as one message
+DISCORD_LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '2'))
+# Optional file to append structured (JSON lines) command logs to
+DISCORD_LOG_FILE = os.getenv('LOG_FILE') or None
 
 # Configure Lavalink server
 # Set Lavalink server IP or hostname
@@ -28,24 +45,143 @@ DISCORD_LAVALINK_PASSWORD = os.getenv('LAVALINK_PASSWORD')
 # Set Lavalink server Discord Region
 DISCORD_LAVALINK_REGION = os.getenv('LAVALINK_REGION')
 
+
+def _nodes(value: str):
+    """
+    Parse a comma separated list of host:port[:region] Lavalink nodes.
+    Nodes share the Lavalink password and default to the Lavalink region.
+    """
+    nodes = []
+    for entry in filter(None, (part.strip() for part in (value or '').split(','))):
+        host, port, *region = entry.split(':')
+        nodes.append({
+            'host': host,
+            'port': int(port),
+            'password': DISCORD_LAVALINK_PASSWORD,
+            'region': region[0] if region else DISCORD_LAVALINK_REGION,
+            'name': entry,
+        })
+    return nodes
+
+
+# Set a list of Lavalink nodes to spread players over, defaults to the single server above
+DISCORD_LAVALINK_NODES = _nodes(os.getenv('LAVALINK_NODES')) or [{
+    'host': DISCORD_LAVALINK_HOST,
+    'port': DISCORD_LAVALINK_PORT,
+    'password': DISCORD_LAVALINK_PASSWORD,
+    'region': DISCORD_LAVALINK_REGION,
+}]
+# Seconds without stats before a node is treated as unhealthy, Lavalink sends stats every minute
+DISCORD_LAVALINK_STATS_TIMEOUT = _int(os.getenv('LAVALINK_STATS_TIMEOUT', '150'))
+
 # Configure Spotify Auth
 # Spotify account
 DISCORD_SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 # Spotify Token
 DISCORD_SPOTIFY_CLIENT_TOKEN = os.getenv('SPOTIFY_CLIENT_TOKEN')
+# Spotify Web API and token endpoints, override to point at a local test server
+DISCORD_SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com/v1')
+DISCORD_SPOTIFY_AUTH_URL = os.getenv('SPOTIFY_AUTH_URL', 'https://accounts.spotify.com/api/token')
+# Total timeout in seconds for a single Spotify request
+DISCORD_SPOTIFY_TIMEOUT = _int(os.getenv('SPOTIFY_TIMEOUT', '10'))
+
+# Seconds between progress updates while importing a Spotify album or playlist
+DISCORD_IMPORT_PROGRESS_INTERVAL = _int(os.getenv('IMPORT_PROGRESS_INTERVAL', '3'))
+# Queue Spotify songs as metadata and only search for them shortly before they play
+DISCORD_LAZY_IMPORTS = os.getenv('LAZY_IMPORTS', 'true').lower() in ('1', 'true', 'yes')
+# Number of upcoming songs that are searched for ahead of playback
+DISCORD_PREFETCH_WINDOW = _int(os.getenv('PREFETCH_WINDOW', '3'))
+
+# Configure Spotify to YouTube track resolution
+# Maximum number of searches running against Lavalink at the same time
+DISCORD_RESOLVE_CONCURRENCY = _int(os.getenv('RESOLVE_CONCURRENCY', '4'))
+# Timeout in seconds for a single search
+DISCORD_RESOLVE_TIMEOUT = _int(os.getenv('RESOLVE_TIMEOUT', '10'))
+# Number of retries for a search that failed with a transient error
+DISCORD_RESOLVE_RETRIES = _int(os.getenv('RESOLVE_RETRIES', '2'))
+# Base delay in seconds between retries, doubled after every attempt
+DISCORD_RESOLVE_BACKOFF = float(os.getenv('RESOLVE_BACKOFF', '0.5'))
+# Seconds a search result may differ from the Spotify song's duration to count as a match
+DISCORD_MATCH_TOLERANCE = _int(os.getenv('MATCH_TOLERANCE', '5'))
+# SQLite file that keeps which track every Spotify song was matched to, leave empty to only keep it in memory
+DISCORD_SPOTIFY_MAP_PATH = os.getenv('SPOTIFY_MAP_PATH') or None
+
+# Configure the Lavalink search result cache
+# Number of results kept in memory
+DISCORD_TRACK_CACHE_SIZE = _int(os.getenv('TRACK_CACHE_SIZE', '2000'))
+# Seconds before a cached result is searched again
+DISCORD_TRACK_CACHE_TTL = _int(os.getenv('TRACK_CACHE_TTL', '604800'))
+# SQLite file that keeps results across restarts, leave empty to only cache in memory
+DISCORD_TRACK_CACHE_PATH = os.getenv('TRACK_CACHE_PATH') or None
+# Number of results kept on disk
+DISCORD_TRACK_CACHE_DISK_SIZE = _int(os.getenv('TRACK_CACHE_DISK_SIZE', '50000'))
+
+# Maximum number of songs in a guild's queue
+DISCORD_QUEUE_LIMIT = _int(os.getenv('QUEUE_LIMIT', '5000'))
+# Seconds a command waits for the Lavalink connection during startup before it is turned away
+DISCORD_STARTUP_WAIT = _int(os.getenv('STARTUP_WAIT', '30'))
+# Seconds the player stays paused after the last listener left before it disconnects, 0 disconnects right away
+DISCORD_IDLE_TIMEOUT = _int(os.getenv('IDLE_TIMEOUT', '120'))
+
+# Configure queue persistence across restarts
+# SQLite file that keeps every guild's queue, leave empty to disable
+DISCORD_QUEUE_STORE_PATH = os.getenv('QUEUE_STORE_PATH') or None
+# Seconds between writes of queue changes and playback positions
+DISCORD_QUEUE_STORE_INTERVAL = _int(os.getenv('QUEUE_STORE_INTERVAL', '5'))
+
+# Configure the play history /music suggests songs from
+# SQLite file that keeps the history across restarts, leave empty to only keep it in memory
+DISCORD_HISTORY_PATH = os.getenv('HISTORY_PATH') or None
+# Number of songs remembered per guild
+DISCORD_HISTORY_SIZE = _int(os.getenv('HISTORY_SIZE', '1000'))
+
+# Configure saved playlists
+# SQLite file that keeps every guild's saved playlists, leave empty to only keep them until a restart
+DISCORD_PLAYLIST_PATH = os.getenv('PLAYLIST_PATH') or None
+# Maximum number of saved playlists per guild
+DISCORD_PLAYLIST_LIMIT = _int(os.getenv('PLAYLIST_LIMIT', '50'))
+
+# Configure the now playing message
+# Minimum seconds between two edits of a guild's now playing message
+DISCORD_NOW_PLAYING_INTERVAL = _int(os.getenv('NOW_PLAYING_INTERVAL', '5'))
+# Seconds between position updates of the now playing message, 0 disables them
+DISCORD_NOW_PLAYING_REFRESH = _int(os.getenv('NOW_PLAYING_REFRESH', '15'))
+
+# Configure the metrics endpoint
+# Port to serve Prometheus metrics on /metrics, leave empty to disable
+DISCORD_METRICS_PORT = _int(os.getenv('METRICS_PORT'))
+# Address the metrics endpoint listens on
+DISCORD_METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Set up a list of Guilds to connect, comma separated GUILD_IDS or the single GUILD_ID
+DISCORD_GUILD_IDS = _ints(os.getenv('GUILD_IDS')) or [DISCORD_GUILD_ID]
+
+# Configure sharding
+# Run the bot as an AutoShardedBot
+DISCORD_SHARDED = os.getenv('SHARDED', 'false').lower() in ('1', 'true', 'yes')
+# Total number of shards, leave empty to use the number Discord recommends
+DISCORD_SHARD_COUNT = _int(os.getenv('SHARD_COUNT'))
+# Shards this process runs, e.g. 0-3 or 0,2, leave empty to run all of them
+DISCORD_SHARD_IDS = _ints(os.getenv('SHARD_IDS')) or None
+# Number of worker processes to split SHARD_COUNT shards over
+DISCORD_SHARD_PROCESSES = _int(os.getenv('SHARD_PROCESSES', '1'))
+# Index of this worker process, set for every worker by the supervisor
+DISCORD_SHARD_WORKER = _int(os.getenv('SHARD_WORKER', '0'))
 
-# Set up a list of Guilds to connect, only one in this case
-DISCORD_GUILD_IDS = [DISCORD_GUILD_ID]
+# Run without the members and presences intents, only members seen in voice channels are cached
+DISCORD_LEAN_MEMBERS = os.getenv('LEAN_MEMBERS', 'false').lower() in ('1', 'true', 'yes')
 
 # Define which intents the bot requires to function
 INTENTS = discord.Intents(
-    members=True, 
-    presences=True, 
+    members=not DISCORD_LEAN_MEMBERS, 
+    presences=not DISCORD_LEAN_MEMBERS, 
     voice_states=True, 
     guild_messages=True, 
     guilds=True, 
     message_content = True
 )
+# Cache the members the intents allow, with lean members that is only members in voice channels
+MEMBER_CACHE_FLAGS = discord.MemberCacheFlags.from_intents(INTENTS)
 
 #  The default cog(s) to be started
 DISCORD_COGS = [
@@ -0,0 +1,70 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import settings
+
+_log = logging.getLogger(__name__)
+
+
+def split(shard_count, processes):
+    """
+    Split the shards into contiguous ranges, one per worker process
+    :param shard_count: total number of shards
+    :param processes: number of worker processes
+    :return: list of shard id lists
+    """
+    return [list(range(index * shard_count // processes, (index + 1) * shard_count // processes))
+            for index in range(processes)]
+
+
+def owns_guild(client, guild_id):
+    """
+    Check whether a guild is served by one of this process' shards
+    :param client: bot
+    :param guild_id: guild id
+    """
+    shard_ids = getattr(client, 'shard_ids', None)
+    shard_count = getattr(client, 'shard_count', None)
+    if not shard_ids or not shard_count:
+        return True
+    return (guild_id >> 22) % shard_count in shard_ids
+
+
+def _start(script, index, shard_ids):
+    env = dict(os.environ, SHARDED='true', SHARD_COUNT=str(settings.DISCORD_SHARD_COUNT),
+               SHARD_IDS=",".join(map(str, shard_ids)), SHARD_WORKER=str(index),
+               SHARD_PROCESSES=str(settings.DISCORD_SHARD_PROCESSES))
+    if settings.DISCORD_METRICS_PORT:
+        env['METRICS_PORT'] = str(settings.DISCORD_METRICS_PORT + index)
+    _log.info("Starting shard worker %d with shards %s", index, shard_ids)
+    return subprocess.Popen([sys.executable, script], env=env)
+
+
+def supervise(script, poll=5):
+    """
+    Run every worker process as its own bot with a slice of the shards and restart workers that exit.
+    Workers share the rest of the configuration, including the Lavalink nodes, through the environment.
+    :param script: entry point the workers run
+    :param poll: seconds between checks of the workers
+    """
+    if not settings.DISCORD_SHARD_COUNT:
+        raise RuntimeError("SHARD_COUNT is required to split shards over processes")
+    ranges = split(settings.DISCORD_SHARD_COUNT, settings.DISCORD_SHARD_PROCESSES)
+    workers = [_start(script, index, shard_ids) for index, shard_ids in enumerate(ranges)]
+    try:
+        while True:
+            time.sleep(poll)
+            for index, worker in enumerate(workers):
+                if worker.poll() is not None:
+                    _log.warning("Shard worker %d exited with code %s, restarting", index, worker.returncode)
+                    workers[index] = _start(script, index, ranges[index])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+import metrics
+
+_log = logging.getLogger(__name__)
+
+
+class Flight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Lets everyone asking for the same key at the same time share one in-flight call.
+    Nothing is kept once the call finishes, caching the result is up to the caller.
+    Every caller receives the same result object, copy it before changing it.
+    """
+
+    def __init__(self):
+        self.flights = {}
+
+    def waiters(self, key):
+        """
+        :param key: flight key
+        :return: number of callers sharing the key's in-flight call besides the one that started it
+        """
+        flight = self.flights.get(key)
+        return flight.waiters if flight is not None else 0
+
+    def _landed(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.task.cancelled():
+            flight.task.exception()  # Retrieved here in case every caller gave up
+        metrics.SINGLE_FLIGHT_WAITERS.observe(flight.waiters)
+        if flight.waiters:
+            _log.debug("Shared the lookup of %s with %d waiter(s)", key, flight.waiters)
+
+    async def run(self, key, func):
+        """
+        Run func unless a call for the same key is already in flight, in which case wait for that one
+        :param key: normalized key, e.g. a cache key
+        :param func: coroutine function to call
+        :return: result of the shared call
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = Flight(asyncio.ensure_future(func()))
+            flight.task.add_done_callback(lambda _: self._landed(key, flight))
+            metrics.SINGLE_FLIGHT.inc(result='started')
+        else:
+            flight.waiters += 1
+            metrics.SINGLE_FLIGHT.inc(result='shared')
+        # A caller giving up must not cancel the call for the others
+        return await asyncio.shield(flight.task)
@@ -0,0 +1,95 @@
+import asyncio
+import concurrent.futures
+import os
+import sqlite3
+import time
+
+import settings
+
+
+class SpotifyTrackMap:
+    """
+    Permanent mapping of Spotify track ids to the Lavalink track they were matched to.
+    Unlike the track cache entries never expire, a song that was matched once is never searched for again.
+    Mappings read from disk are kept in memory for the rest of the run.
+    """
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else settings.DISCORD_SPOTIFY_MAP_PATH
+        self._tracks = {}
+        self._db = None
+        # sqlite is blocking, keep all disk access on one worker thread
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        if self.path:
+            self._open()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS spotify_tracks (spotify_id TEXT PRIMARY KEY, track TEXT NOT NULL, "
+                         "isrc TEXT, method TEXT NOT NULL, matched REAL NOT NULL)")
+        self._db.commit()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _disk_get(self, spotify_ids):
+        rows = {}
+        # Stay below SQLite's limit on query parameters
+        for start in range(0, len(spotify_ids), 500):
+            chunk = spotify_ids[start:start + 500]
+            rows.update(self._db.execute(f"SELECT spotify_id, track FROM spotify_tracks WHERE spotify_id IN "
+                                         f"({','.join('?' * len(chunk))})", chunk).fetchall())
+        return rows
+
+    def _disk_set(self, spotify_id, track, isrc, method):
+        self._db.execute("INSERT OR REPLACE INTO spotify_tracks (spotify_id, track, isrc, method, matched) "
+                         "VALUES (?, ?, ?, ?, ?)", (spotify_id, track, isrc, method, time.time()))
+        self._db.commit()
+
+    async def get_many(self, spotify_ids):
+        """
+        :param spotify_ids: Spotify track ids
+        :return: dict of the matched ids to their encoded Lavalink track
+        """
+        found = {spotify_id: self._tracks[spotify_id] for spotify_id in spotify_ids if spotify_id in self._tracks}
+        missing = [spotify_id for spotify_id in spotify_ids if spotify_id not in found]
+        if missing and self._db is not None:
+            rows = await self._run(self._disk_get, missing)
+            self._tracks.update(rows)
+            found.update(rows)
+        return found
+
+    async def get(self, spotify_id):
+        """
+        :param spotify_id: Spotify track id
+        :return: encoded Lavalink track or None when the song was never matched
+        """
+        return (await self.get_many([spotify_id])).get(spotify_id)
+
+    async def known(self, spotify_ids):
+        """
+        :param spotify_ids: Spotify track ids
+        :return: set of the ids that are matched already
+        """
+        return set(await self.get_many(spotify_ids))
+
+    async def set(self, spotify_id, track, isrc=None, method=None):
+        """
+        Remember the track a song was matched to
+        :param spotify_id: Spotify track id
+        :param track: encoded Lavalink track
+        :param isrc: the song's ISRC
+        :param method: how the match was found, e.g. isrc or duration
+        """
+        self._tracks[spotify_id] = track
+        if self._db is not None:
+            await self._run(self._disk_set, spotify_id, track, isrc, method or 'unknown')
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._db is not None:
+            self._db.close()
+            self._db = None
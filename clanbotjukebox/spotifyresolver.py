@@ -0,0 +1,174 @@
+import asyncio
+import base64
+import collections
+import re
+import time
+
+import aiohttp
+
+import settings
+
+RSPOTIFY = re.compile(r'(?:open\.spotify\.com/(?:[\w-]+/)?|spotify:)(track|album|playlist)[/:]([A-Za-z0-9]+)')
+
+# Metadata of a Spotify song, query is the "artist - title" string used to search for it
+Song = collections.namedtuple('Song', ['query', 'title', 'author', 'duration', 'uri', 'id', 'isrc'],
+                              defaults=(None, None))
+
+
+class SpotifyError(Exception):
+    pass
+
+
+class SpotifyResolver:
+    """
+    Non-blocking Spotify Web API client.
+    Keeps one pooled HTTP session and reuses the client credentials token until it expires.
+    """
+
+    def __init__(self, client_id, client_secret, api_url=None, auth_url=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = (api_url or settings.DISCORD_SPOTIFY_API_URL).rstrip('/')
+        self.auth_url = auth_url or settings.DISCORD_SPOTIFY_AUTH_URL
+        self._session = None
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = asyncio.Lock()
+
+    @staticmethod
+    def parse(query):
+        """
+        Split a Spotify URL or URI into its kind and id
+        :param query: Spotify URL or URI
+        :return: (kind, id) tuple or None when the query is not a Spotify link
+        """
+        match = RSPOTIFY.search(query)
+        if not match:
+            return None
+        return match.group(1), match.group(2)
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=settings.DISCORD_SPOTIFY_TIMEOUT))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def token(self):
+        """
+        Return a valid access token, requesting a new one only when the cached token is about to expire
+        :return: access token
+        """
+        if self._token and time.monotonic() < self._token_expires:
+            return self._token
+        async with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires:
+                return self._token
+            credentials = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+            async with self.session.post(self.auth_url, data={'grant_type': 'client_credentials'},
+                                         headers={'Authorization': f'Basic {credentials}'}) as res:
+                if res.status != 200:
+                    raise SpotifyError(f"Spotify authentication failed: {res.status}")
+                data = await res.json()
+            self._token = data['access_token']
+            # Refresh a minute early so a token never expires halfway through an import
+            self._token_expires = time.monotonic() + data.get('expires_in', 3600) - 60
+            return self._token
+
+    async def request(self, url, **params):
+        """
+        GET a Spotify Web API resource, refreshing the token on 401 and honouring Retry-After on 429
+        :param url: absolute url or path relative to the api url
+        :return: decoded json body
+        """
+        if not url.startswith('http'):
+            url = f"{self.api_url}/{url.lstrip('/')}"
+        for _ in range(3):
+            headers = {'Authorization': f'Bearer {await self.token()}'}
+            async with self.session.get(url, params=params or None, headers=headers) as res:
+                if res.status == 200:
+                    return await res.json()
+                if res.status == 401:
+                    self._token = None
+                    continue
+                if res.status == 429:
+                    await asyncio.sleep(float(res.headers.get('Retry-After', 1)))
+                    continue
+                raise SpotifyError(f"Spotify request failed: {res.status} {url}")
+        raise SpotifyError(f"Spotify request kept failing: {url}")
+
+    @staticmethod
+    def _song(track, artist):
+        url = track.get('external_urls', {}).get('spotify') or f"https://open.spotify.com/track/{track.get('id')}"
+        return Song(f"{artist} - {track['name']}", track['name'], artist, track.get('duration_ms', 0), url,
+                    track.get('id'), track.get('external_ids', {}).get('isrc'))
+
+    async def isrcs(self, track_ids):
+        """
+        Look up the ISRCs of tracks, album pages only list simplified tracks without them
+        :param track_ids: Spotify track ids
+        :return: dict of track id to ISRC
+        """
+        isrcs = {}
+        for start in range(0, len(track_ids), 50):
+            tracks = (await self.request('tracks', ids=",".join(track_ids[start:start + 50])))['tracks']
+            isrcs.update((track['id'], track.get('external_ids', {}).get('isrc')) for track in tracks if track)
+        return isrcs
+
+    async def iter_songs(self, query, known=None):
+        """
+        Stream a Spotify track, album or playlist link as Song metadata,
+        following the paging links so imports are not capped at the first page
+        :param query: Spotify URL or URI
+        :param known: optional coroutine function returning which of the given track ids are already matched,
+                      their ISRCs are not looked up
+        :return: async generator of Song tuples
+        """
+        parsed = self.parse(query)
+        if not parsed:
+            return
+        kind, spotify_id = parsed
+        match kind:
+            case 'track':
+                track = await self.request(f'tracks/{spotify_id}')
+                yield self._song(track, track['album']['artists'][0]['name'])
+            case 'album':
+                page = (await self.request(f'albums/{spotify_id}'))['tracks']
+                while page:
+                    songs = [self._song(track, track['artists'][0]['name']) for track in page['items']]
+                    missing = [song.id for song in songs if song.id]
+                    if known is not None and missing:
+                        matched = await known(missing)
+                        missing = [track_id for track_id in missing if track_id not in matched]
+                    isrcs = await self.isrcs(missing) if missing else {}
+                    for song in songs:
+                        yield song._replace(isrc=isrcs.get(song.id)) if song.id in isrcs else song
+                    page = await self.request(page['next']) if page.get('next') else None
+            case 'playlist':
+                page = (await self.request(f'playlists/{spotify_id}'))['tracks']
+                while page:
+                    for track in page['items']:
+                        actualtrack = track['track']  # why
+                        if actualtrack:
+                            yield self._song(actualtrack, actualtrack['album']['artists'][0]['name'])
+                    page = await self.request(page['next']) if page.get('next') else None
+
+    async def iter_tracks(self, query):
+        """
+        Stream a Spotify track, album or playlist link as "artist - title" search strings
+        :param query: Spotify URL or URI
+        :return: async generator of search strings
+        """
+        async for song in self.iter_songs(query):
+            yield song.query
+
+    async def get_tracks(self, query):
+        """
+        Resolve a Spotify track, album or playlist link to "artist - title" search strings
+        :param query: Spotify URL or URI
+        :return: list of search strings
+        """
+        return [song async for song in self.iter_tracks(query)]
@@ -0,0 +1,66 @@
+import asyncio
+import base64
+import binascii
+import logging
+import time
+
+import metrics
+
+_log = logging.getLogger(__name__)
+
+STARTED = time.monotonic()
+_finished = set()
+
+
+def user_id_from_token(token):
+    """
+    Read the bot's user id from its token, the first part of a bot token is the base64 encoded id.
+    This lets Lavalink connect while the gateway is still logging in instead of after on_ready.
+    :param token: bot token
+    :return: user id or None when the token does not have the expected format
+    """
+    try:
+        encoded = token.split('.')[0]
+        return int(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+    except (AttributeError, ValueError, binascii.Error):
+        return None
+
+
+def phase(name):
+    """
+    Record how long after process start a startup phase first finished, later reconnects are not startup
+    :param name: phase name
+    """
+    if name in _finished:
+        return
+    _finished.add(name)
+    seconds = time.monotonic() - STARTED
+    metrics.STARTUP_PHASE.set(round(seconds, 3), phase=name)
+    _log.info("Startup phase %s finished after %.2fs", name, seconds)
+
+
+class Readiness:
+    """
+    Gate for commands and events that need Lavalink, which connects in parallel with the gateway login
+    """
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def set(self):
+        self._event.set()
+
+    async def wait(self, timeout):
+        """
+        Wait until ready
+        :param timeout: seconds to wait at most
+        :return: whether the gate opened in time
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
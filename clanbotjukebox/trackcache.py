@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+import lavalink
+
+import metrics
+import settings
+from singleflight import SingleFlight
+
+_log = logging.getLogger(__name__)
+
+RWHITESPACE = re.compile(r'\s+')
+CACHEABLE = (lavalink.LoadType.TRACK, lavalink.LoadType.PLAYLIST, lavalink.LoadType.SEARCH)
+
+
+class TrackCache:
+    """
+    Cache in front of Lavalink get_tracks lookups.
+    Results live in an in-memory LRU and, when a path is configured, in a SQLite file that survives restarts.
+    Only the raw track dicts are stored so every hit hands out fresh AudioTrack objects.
+    """
+
+    def __init__(self, max_size=None, ttl=None, path=None, disk_size=None):
+        self.max_size = max_size or settings.DISCORD_TRACK_CACHE_SIZE
+        self.ttl = ttl or settings.DISCORD_TRACK_CACHE_TTL
+        self.disk_size = disk_size or settings.DISCORD_TRACK_CACHE_DISK_SIZE
+        self.path = path if path is not None else settings.DISCORD_TRACK_CACHE_PATH
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._db = None
+        # sqlite is blocking, keep all disk access on one worker thread
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._writes = 0
+        # Identical lookups that miss at the same time share one Lavalink request
+        self.flights = SingleFlight()
+        if self.path:
+            try:
+                self._open()
+            except sqlite3.Error:
+                # Without the file the cache still works, it just starts cold after a restart
+                _log.exception("Failed to open the track cache file %s, caching in memory only", self.path)
+                if self._db is not None:
+                    self._db.close()
+                    self._db = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS track_cache "
+                         "(key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)")
+        self._db.commit()
+
+    @staticmethod
+    def normalize(query):
+        """
+        Build the cache key for a query. Searches are case and whitespace insensitive, URLs are kept as-is
+        :param query: Lavalink identifier
+        :return: cache key
+        """
+        query = query.strip()
+        if query.startswith(('ytsearch:', 'ytmsearch:', 'scsearch:')):
+            prefix, _, terms = query.partition(':')
+            return f"{prefix}:{RWHITESPACE.sub(' ', terms).strip().lower()}"
+        return query
+
+    @staticmethod
+    def _dump(results):
+        return {
+            'loadType': results.load_type.value,
+            'playlistInfo': {'name': results.playlist_info.name,
+                             'selectedTrack': results.playlist_info.selected_track},
+            'tracks': [track._raw for track in results.tracks],
+        }
+
+    @staticmethod
+    def copy(results):
+        """
+        Give a caller its own tracks, players set the requester and queue metadata on the AudioTrack objects
+        :param results: LoadResult that may be shared with other callers
+        :return: LoadResult with fresh AudioTrack objects
+        """
+        return lavalink.LoadResult(results.load_type, [lavalink.AudioTrack(track._raw, 0) for track in results.tracks],
+                                   results.playlist_info)
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _remember(self, key, payload, expires):
+        self._entries[key] = (expires, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        row = self._db.execute("SELECT payload, expires FROM track_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self._db:
+            if row[1] < now:
+                self._db.execute("DELETE FROM track_cache WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE track_cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key, payload, expires, now):
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO track_cache (key, payload, expires, accessed) "
+                             "VALUES (?, ?, ?, ?)", (key, json.dumps(payload, separators=(',', ':')), expires, now))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._db.execute("DELETE FROM track_cache WHERE expires < ?", (now,))
+                self._db.execute("DELETE FROM track_cache WHERE key NOT IN "
+                                 "(SELECT key FROM track_cache ORDER BY accessed DESC LIMIT ?)", (self.disk_size,))
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, query):
+        """
+        Look up a cached result
+        :param query: Lavalink identifier
+        :return: LoadResult or None on a miss
+        """
+        key = self.normalize(query)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return lavalink.LoadResult.from_dict(entry[1])
+            del self._entries[key]
+        if self._db is not None:
+            try:
+                row = await self._run(self._disk_get, key, now)
+            except sqlite3.Error:
+                # A locked or broken file only costs the disk tier, answer from memory and Lavalink
+                _log.exception("Failed to read %s from the track cache file", key)
+                row = None
+            if row is not None:
+                payload, expires = row
+                self._remember(key, payload, expires)
+                self.hits += 1
+                self.disk_hits += 1
+                return lavalink.LoadResult.from_dict(payload)
+        self.misses += 1
+        return None
+
+    async def set(self, query, results):
+        """
+        Store a result when it is worth caching
+        :param query: Lavalink identifier
+        :param results: LoadResult returned by Lavalink
+        """
+        if results.load_type not in CACHEABLE or not results.tracks:
+            return
+        key = self.normalize(query)
+        now = time.time()
+        payload = self._dump(results)
+        self._remember(key, payload, now + self.ttl)
+        if self._db is not None:
+            try:
+                await self._run(self._disk_set, key, payload, now + self.ttl, now)
+            except sqlite3.Error:
+                _log.exception("Failed to write %s to the track cache file", key)
+
+    async def load(self, query, fetch):
+        """
+        Look up a query, calling fetch on a miss. Concurrent misses of the same query share one fetch,
+        every caller gets its own copy of the result.
+        :param query: Lavalink identifier
+        :param fetch: coroutine function returning the LoadResult and caching it
+        :return: LoadResult
+        """
+        results = await self.get(query)
+        if results is not None:
+            return results
+        return self.copy(await self.flights.run(self.normalize(query), fetch))
+
+    async def get_tracks(self, node, query):
+        """
+        Drop-in replacement for node.get_tracks that skips the REST call on a hit
+        :param node: Lavalink node to search on when the query is not cached
+        :param query: Lavalink identifier
+        :return: LoadResult
+        """
+        async def fetch():
+            results = await metrics.get_tracks(node, query)
+            await self.set(query, results)
+            return results
+
+        return await self.load(query, fetch)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._db is not None:
+            self._db.close()
+            self._db = None
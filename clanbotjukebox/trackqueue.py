@@ -0,0 +1,84 @@
+import collections
+
+
+class TrackQueue(list):
+    """
+    Player queue that keeps its total duration and the number of tracks per requester up to date
+    as tracks are added or removed, so the queue view never has to walk the whole queue.
+    """
+
+    def __init__(self, tracks=()):
+        super().__init__()
+        self.duration = 0
+        self.requesters = collections.Counter()
+        self.extend(tracks)
+
+    def _added(self, track):
+        self.duration += track.duration
+        self.requesters[track.requester] += 1
+
+    def _removed(self, track):
+        self.duration -= track.duration
+        self.requesters[track.requester] -= 1
+        if self.requesters[track.requester] <= 0:
+            del self.requesters[track.requester]
+
+    def append(self, track):
+        super().append(track)
+        self._added(track)
+
+    def insert(self, index, track):
+        super().insert(index, track)
+        self._added(track)
+
+    def extend(self, tracks):
+        tracks = list(tracks)
+        super().extend(tracks)
+        for track in tracks:
+            self._added(track)
+
+    def __iadd__(self, tracks):
+        self.extend(tracks)
+        return self
+
+    def pop(self, index=-1):
+        track = super().pop(index)
+        self._removed(track)
+        return track
+
+    def remove(self, track):
+        super().remove(track)
+        self._removed(track)
+
+    def clear(self):
+        super().clear()
+        self.duration = 0
+        self.requesters.clear()
+
+    def __setitem__(self, index, value):
+        old = self[index]
+        if isinstance(index, slice):
+            value = list(value)
+        super().__setitem__(index, value)
+        for track in old if isinstance(index, slice) else (old,):
+            self._removed(track)
+        for track in value if isinstance(index, slice) else (value,):
+            self._added(track)
+
+    def __delitem__(self, index):
+        old = self[index]
+        super().__delitem__(index)
+        for track in old if isinstance(index, slice) else (old,):
+            self._removed(track)
+
+    def pages(self, size=10):
+        return max((len(self) - 1) // size, 0)
+
+    def page(self, number, size=10):
+        """
+        Slice one page out of the queue
+        :param number: zero based page number
+        :param size: tracks per page
+        :return: tracks on that page
+        """
+        return self[number * size:(number + 1) * size]
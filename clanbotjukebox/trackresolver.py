@@ -0,0 +1,282 @@
+import asyncio
+import collections
+import contextlib
+import random
+import re
+
+import aiohttp
+import lavalink
+
+import metrics
+import settings
+from singleflight import SingleFlight
+from spotifyresolver import Song
+from trackcache import TrackCache
+
+# Errors worth retrying: the node or YouTube is busy, not the query being wrong
+TRANSIENT_ERRORS = (asyncio.TimeoutError, aiohttp.ClientError, lavalink.NodeError)
+
+Resolved = collections.namedtuple('Resolved', ['query', 'track', 'error'])
+
+# Parts of a song title that uploads often leave out, e.g. (feat. Someone) or - Remastered 2011
+TITLE_EXTRAS = re.compile(r'\(.*?\)|\[.*?\]| - .*')
+WORDS = re.compile(r'\w+')
+
+
+class TransientLoadError(Exception):
+    pass
+
+
+class TrackResolver:
+    """
+    Resolves search queries to Lavalink tracks with a shared concurrency limit,
+    a timeout per query and jittered exponential backoff on transient failures.
+    """
+
+    def __init__(self, concurrency=None, timeout=None, retries=None, backoff=None, cache=None, mapping=None,
+                 tolerance=None):
+        self.concurrency = concurrency or settings.DISCORD_RESOLVE_CONCURRENCY
+        self.timeout = timeout or settings.DISCORD_RESOLVE_TIMEOUT
+        self.retries = settings.DISCORD_RESOLVE_RETRIES if retries is None else retries
+        self.backoff = backoff or settings.DISCORD_RESOLVE_BACKOFF
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.cache = cache
+        self.flights = SingleFlight()
+        self.mapping = mapping
+        self.tolerance = (settings.DISCORD_MATCH_TOLERANCE if tolerance is None else tolerance) * 1000
+
+    async def load(self, node, query):
+        """
+        Run a single get_tracks call under the concurrency limit and timeout
+        :param node: Lavalink node to search on
+        :param query: Lavalink identifier, e.g. ytsearch:artist - title
+        :return: LoadResult
+        """
+        async def fetch():
+            async with self.semaphore:
+                results = await asyncio.wait_for(metrics.get_tracks(node, query), timeout=self.timeout)
+            if results.load_type == lavalink.LoadType.LOAD_FAILED:
+                raise TransientLoadError(f"Lavalink failed to load {query}")
+            if self.cache is not None:
+                await self.cache.set(query, results)
+            return results
+
+        if self.cache is not None:
+            return await self.cache.load(query, fetch)
+        return TrackCache.copy(await self.flights.run(TrackCache.normalize(query), fetch))
+
+    async def search(self, node, query):
+        """
+        Resolve a query to its tracks, retrying transient errors
+        :param node: Lavalink node to search on
+        :param query: Lavalink identifier
+        :return: list of matching tracks
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                results = await self.load(node, query)
+            except (*TRANSIENT_ERRORS, TransientLoadError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+            return results.tracks
+
+    async def resolve_one(self, node, query):
+        """
+        Resolve a query to its first track, retrying transient errors
+        :param node: Lavalink node to search on
+        :param query: Lavalink identifier
+        :return: first matching track or None when there are no matches
+        """
+        tracks = await self.search(node, query)
+        return tracks[0] if tracks else None
+
+    @staticmethod
+    def _similar(track, song):
+        # Uploads put the artist in the title or in the channel name (ArtistVEVO, Artist - Topic), look in both
+        found = f'{track.title} {track.author}'.casefold()
+        title = WORDS.findall(TITLE_EXTRAS.sub('', song.title).casefold()) or WORDS.findall(song.title.casefold())
+        artist = ''.join(WORDS.findall(song.author.casefold()))
+        return set(title) <= set(WORDS.findall(found)) and artist in ''.join(WORDS.findall(found))
+
+    def _closest(self, tracks, song):
+        # Results come ranked, take the first one that is about as long as the song and carries its title and artist
+        if not song.duration:
+            return None  # Nothing to verify a result against
+        for track in tracks:
+            if abs(track.duration - song.duration) <= self.tolerance and self._similar(track, song):
+                return track
+        return None
+
+    async def resolve_song(self, node, song):
+        """
+        Find the track for a Spotify song: the stored match, then a search for its ISRC, then a search for artist
+        and title, each only accepting a result of about the song's duration with its title and artist. Matches are
+        stored for good, so a known song never needs a search. When no result can be verified the first one is used
+        unstored.
+        :param node: Lavalink node to search on
+        :param song: spotifyresolver.Song
+        :return: AudioTrack or None when there are no matches
+        """
+        if self.mapping is not None and song.id:
+            encoded = await self.mapping.get(song.id)
+            if encoded is not None:
+                metrics.SPOTIFY_MATCHES.inc(method='stored')
+                return lavalink.decode_track(encoded)
+        track = method = None
+        isrc_tracks = []
+        if song.isrc:
+            try:
+                isrc_tracks = await self.search(node, f'ytsearch:"{song.isrc}"')
+            except (*TRANSIENT_ERRORS, TransientLoadError):
+                pass  # The artist and title search below may still work
+            track, method = self._closest(isrc_tracks, song), 'isrc'
+        if track is None:
+            tracks = await self.search(node, f'ytsearch:{song.query}')
+            track, method = self._closest(tracks, song), 'duration'
+            if track is None and (tracks or isrc_tracks):
+                track, method = (tracks or isrc_tracks)[0], 'first'
+        metrics.SPOTIFY_MATCHES.inc(method=method if track is not None else 'none')
+        if track is not None and method != 'first' and self.mapping is not None and song.id:
+            await self.mapping.set(song.id, track.track, song.isrc, method)
+        return track
+
+    async def _result(self, query, task):
+        try:
+            track = await task
+        except Exception as e:
+            return Resolved(query, None, str(e) or type(e).__name__)
+        if track is None:
+            return Resolved(query, None, "no matches")
+        return Resolved(query, track, None)
+
+    async def resolve(self, node, queries, prefix='ytsearch:'):
+        """
+        Resolve queries concurrently while yielding results in the original order.
+        A failed query yields a Resolved with an error instead of cancelling the rest.
+        :param node: Lavalink node to search on
+        :param queries: iterable or async iterable of search strings or Spotify Songs
+        :param prefix: search prefix prepended to every query
+        :return: async generator of Resolved tuples
+        """
+        pending = collections.deque()
+        window = self.concurrency * 2
+
+        async def _queries():
+            if hasattr(queries, '__aiter__'):
+                async for query in queries:
+                    yield query
+            else:
+                for query in queries:
+                    yield query
+
+        try:
+            async with contextlib.aclosing(_queries()) as source:
+                async for query in source:
+                    if isinstance(query, Song):
+                        pending.append((query.query, asyncio.ensure_future(self.resolve_song(node, query))))
+                    else:
+                        pending.append((query, asyncio.ensure_future(self.resolve_one(node, f'{prefix}{query}'))))
+                    if len(pending) >= window:
+                        yield await self._result(*pending.popleft())
+            while pending:
+                yield await self._result(*pending.popleft())
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+
+class LazyTrack(lavalink.DeferredAudioTrack):
+    """
+    Queue entry that only holds song metadata. It is searched for when the prefetcher reaches it,
+    or at the latest when Lavalink asks for it in DefaultPlayer.play.
+    """
+    resolver = None
+
+    def __init__(self, data, requester, **extra):
+        super().__init__(data, requester, **extra)
+        self._resolving = None
+        # Node of the player that is about to play the entry, set by the player
+        self.node = None
+
+    @classmethod
+    def from_song(cls, song, requester):
+        """
+        Build an unresolved queue entry from song metadata
+        :param song: spotifyresolver.Song
+        :param requester: id of the user that requested the song
+        :return: LazyTrack
+        """
+        info = {'identifier': song.uri, 'isSeekable': True, 'author': song.author, 'length': song.duration,
+                'isStream': False, 'title': song.title, 'uri': song.uri, 'sourceName': 'spotify'}
+        metrics.LAZY_TRACKS.inc(result='queued')
+        return cls({'info': info}, requester, query=song.query, spotify_id=song.id, isrc=song.isrc)
+
+    @classmethod
+    def from_dict(cls, data, requester):
+        """
+        Rebuild a queue entry stored with to_dict
+        :param data: dict returned by to_dict
+        :param requester: id of the user that requested the song
+        :return: LazyTrack
+        """
+        return cls({'info': data['info'], 'track': data.get('track')}, requester, query=data['query'],
+                   spotify_id=data.get('spotify_id'), isrc=data.get('isrc'))
+
+    def to_dict(self):
+        return {'info': self._raw['info'], 'track': self.track, 'query': self.extra['query'],
+                'spotify_id': self.extra.get('spotify_id'), 'isrc': self.extra.get('isrc')}
+
+    @property
+    def song(self):
+        info = self._raw['info']
+        return Song(self.extra['query'], info['title'], info['author'], info['length'], info['uri'],
+                    self.extra.get('spotify_id'), self.extra.get('isrc'))
+
+    @property
+    def resolved(self):
+        return self.track is not None
+
+    async def _resolve(self, node):
+        try:
+            track = await self.resolver.resolve_song(node, self.song)
+        except Exception as e:
+            metrics.LAZY_TRACKS.inc(result='failed')
+            raise lavalink.LoadError(f"Failed to search for {self.extra['query']}: {str(e) or type(e).__name__}")
+        if track is None:
+            metrics.LAZY_TRACKS.inc(result='failed')
+            raise lavalink.LoadError(f"No matches for {self.extra['query']}")
+        self.track = track.track
+        self.identifier = track.identifier
+        self.uri = track.uri
+        self.source_name = track.source_name
+        # The Spotify duration is kept so queue totals stay consistent
+        self._raw = {'track': track.track, 'info': {**self._raw['info'], 'identifier': track.identifier,
+                                                     'uri': track.uri, 'sourceName': track.source_name}}
+        metrics.LAZY_TRACKS.inc(result='resolved')
+        return self.track
+
+    async def resolve(self, node):
+        """
+        Search for the song once, concurrent callers share the same search
+        :param node: Lavalink node to search on
+        :return: encoded Lavalink track
+        """
+        if self.track is not None:
+            return self.track
+        if self._resolving is None:
+            self._resolving = asyncio.ensure_future(self._resolve(node))
+            self._resolving.add_done_callback(self._resolved)
+        return await asyncio.shield(self._resolving)
+
+    def _resolved(self, task):
+        # Forget failed searches so the entry can be tried again later
+        if task.cancelled() or task.exception() is not None:
+            self._resolving = None
+
+    async def load(self, client):
+        node = self.node if self.node is not None and self.node.available else client.node_manager.find_ideal_node()
+        if node is None:
+            raise lavalink.LoadError("No Lavalink node available")
+        return await self.resolve(node)